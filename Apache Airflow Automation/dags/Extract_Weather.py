@@ -1,21 +1,101 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from meteostat import Daily
+import json
 import os
 import logging
+import pandas as pd
 
-def fetch_weather_data(meteostation: str,start: datetime, end: datetime)-> bytes:
+def fetch_weather_data(meteostation: str,start: datetime, end: datetime)-> pd.DataFrame:
     """
-    Fetches weather data for a given meteostation, start date, and end date,
-    and saves it to an HTML file.
+    Fetches weather data for a given meteostation, start date, and end date.
     
     Parameters:
         meteostation (str): The ID of the meteostation.
-        file_name (str): The name of the HTML file to save the data.
         start (datetime): The start date.
         end (datetime): The end date.
+        
+    Returns:
+        pd.DataFrame: time, tavg, tmin, tmax, prcp, wdir, wspd and pres columns.
     """
     data = Daily(meteostation, start, end).fetch()
     data = data.reset_index().iloc[:, [0, 1, 2, 3, 4, 6, 7, 9]]
+    return data
+
+def read_weather_state(state_path: str) -> dict:
+    """
+    Reads the last date stored per meteostation.
+    
+    Parameters:
+        state_path (str): Path of the JSON state file.
+        
+    Returns:
+        dict: Last stored date (YYYY-MM-DD) keyed by meteostation ID.
+    """
+    try:
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def write_weather_state(state_path: str, state: dict):
+    """
+    Writes the last date stored per meteostation.
+    
+    Parameters:
+        state_path (str): Path of the JSON state file.
+        state (dict): Last stored date (YYYY-MM-DD) keyed by meteostation ID.
+    """
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(state_path + '.tmp', state_path)
+
+def update_weather_store(meteostation: str, store_path: str, start: datetime, end: datetime,
+                         state_path: str = None, refresh_days: int = 3) -> pd.DataFrame:
+    """
+    Brings a local weather store up to date by fetching only the days after the last
+    date already stored for the meteostation, and merging them into the store.
+    
+    The last few stored days are fetched again (refresh_days) because Meteostat
+    completes recent observations after the fact; refetched days replace the stored ones.
+    
+    Parameters:
+        meteostation (str): The ID of the meteostation.
+        store_path (str): Path of the CSV weather store.
+        start (datetime): The start date used when the store is empty.
+        end (datetime): The end date.
+        state_path (str): Path of the JSON state file. Defaults to weather_state.json
+            next to the store.
+        refresh_days (int): Number of already stored days to fetch again. Defaults to 3.
+        
+    Returns:
+        pd.DataFrame: The whole updated store.
+    """
+    if state_path is None:
+        state_path = os.path.join(os.path.dirname(os.path.abspath(store_path)), 'weather_state.json')
+    state = read_weather_state(state_path)
+    stored = None
+    if meteostation in state and os.path.exists(store_path):
+        stored = pd.read_csv(store_path, parse_dates=['time'])
+        last_date = datetime.strptime(state[meteostation], '%Y-%m-%d')
+        start = max(start, last_date - timedelta(days=refresh_days - 1))
+    if start > end:
+        logging.info(f"Weather store for {meteostation} is up to date ({state.get(meteostation)}).")
+        return stored
+
+    new_data = fetch_weather_data(meteostation, start, end)
+    logging.info(f"Fetched {len(new_data)} days of weather for {meteostation} from {start:%Y-%m-%d} to {end:%Y-%m-%d}.")
+    if stored is not None:
+        new_data = pd.concat([stored, new_data], ignore_index=True)
+        new_data = new_data.drop_duplicates(subset='time', keep='last')
+    if new_data.empty:
+        return new_data
+    new_data = new_data.sort_values('time', ignore_index=True)
+
+    new_data.to_csv(store_path + '.tmp', index=False)
+    os.replace(store_path + '.tmp', store_path)
+    state[meteostation] = new_data['time'].max().strftime('%Y-%m-%d')
+    write_weather_state(state_path, state)
+    return new_data
 
 
 def preview_weather_data(meteostation: str, start: datetime, end: datetime, preview_limit: int = 10):
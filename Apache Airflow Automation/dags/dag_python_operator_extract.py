@@ -40,13 +40,12 @@ def extract_kaggle_dataset(dataset_name: str, ti: TaskInstance):
 
 
 def extract_weather(meteostation: str, ti: TaskInstance):
-    output_file_path = f"weather_{ti.run_id}.csv"
+    # The store persists between runs, so a daily run only fetches the new days.
+    output_file_path = "boston_weather_store.csv"
     try:
         start = datetime(2013, 3, 1)
-        end = datetime(2024, 1, 1)
-        meteostation = "72509"
-        content = fetch_weather_data(meteostation, start, end)
-        save_as_csv(content, output_file_path)
+        end = datetime.combine(datetime.now().date(), datetime.min.time())
+        update_weather_store(meteostation, output_file_path, start, end)
         ti.xcom_push(key="weatherdataset", value=output_file_path)
         logging.info("File was successfully saved as " + output_file_path)
     except Exception:
@@ -207,6 +206,7 @@ with DAG(
 ) as dag:
     extract_shootings_task = PythonOperator(
         task_id="extract_shootings_task",
+        execution_timeout=timedelta(minutes=30),
         python_callable=extract_kaggle_dataset,
         op_kwargs={
             "url": "https://data.boston.gov/dataset/e63a37e1-be79-4722-89e6-9e7e2a3da6d1/resource/73c7e069-701f-4910-986d-b950f46c91a1/download/tmp8mntlmrz.csv",
@@ -214,6 +214,7 @@ with DAG(
     )
     extract_crimes_task = PythonOperator(
         task_id="extractkaggle_task",
+        execution_timeout=timedelta(minutes=30),
         python_callable=extract_kaggle_dataset,
         op_kwargs={
             "dataset_name": "AnalyzeBoston/crimes-in-boston",
@@ -221,9 +222,10 @@ with DAG(
     )
     extract_weather_task = PythonOperator(
         task_id="extractweather_task",
+        execution_timeout=timedelta(minutes=30),
         python_callable=extract_weather,
         op_kwargs={
-            "meteostation": "",
+            "meteostation": "72509",
         },
     )
 
@@ -372,9 +374,7 @@ insert_datacrimesweather_task = PostgresBulkLoadOperator(
 
 
 (
-    extract_shootings_task
-    >> extract_crimes_task
-    >> extract_weather_task
+    [extract_shootings_task, extract_crimes_task, extract_weather_task]
     >> transform_kaggle_task
     >> transform_Shootings_task
     >> drop_table_task
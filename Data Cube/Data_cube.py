@@ -1,4 +1,5 @@
 import urllib.parse
+import os
 import sys
 import pandas as pd
 from rdflib import Graph, BNode, Literal, Namespace, URIRef
@@ -19,7 +20,8 @@ SDMX_CODE = Namespace("http://purl.org/linked-data/sdmx/2009/code#")
 
 def load_csv_file_as_dataframe(file_path: str) -> pd.DataFrame:
     """
-    Load a CSV file as a pandas DataFrame.
+    Load a CSV file as a pandas DataFrame. When a Parquet file with the same name and at least
+    as recent sits next to it, that file is read instead, with its stored dtypes.
 
     Args:
         file_path (str): The file path of the CSV file.
@@ -27,8 +29,15 @@ def load_csv_file_as_dataframe(file_path: str) -> pd.DataFrame:
     Returns:
         pd.DataFrame: The pandas DataFrame containing the data from the CSV file.
     """
+    parquet_path = os.path.splitext(file_path)[0] + ".parquet"
+    if os.path.exists(parquet_path) and (not os.path.exists(file_path)
+                                         or os.path.getmtime(parquet_path) >= os.path.getmtime(file_path)):
+        file_path = parquet_path
     try:
-        result = pd.read_csv(file_path, low_memory=False)
+        if file_path.endswith(".parquet"):
+            result = pd.read_parquet(file_path)
+        else:
+            result = pd.read_csv(file_path, low_memory=False)
         logging.info("CSV file loaded successfully.")
         return result
     except Exception as e:
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime
+from typing import Any, Dict, List
+
+from Extract_BotonGOV import fetch_csv_if_modified
+from Extract_Kaggle import download_dataset_kaggle_cached
+from Extract_Weather import fetch_weather_data_and_save
+from timing import timed_call
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+
+def run_extractions(sources: List[Dict[str, Any]], max_workers: int = None, default_timeout: float = 1800) -> Dict[str, Any]:
+    """
+    Runs independent extraction sources concurrently on a thread pool.
+
+    The extractors spend their time waiting on the network, so overlapping them brings
+    the extract phase down to roughly the slowest single source. A source that exceeds
+    its timeout is reported as such; its thread cannot be interrupted and is left to
+    finish in the background.
+
+    Args:
+        sources (list): Dictionaries with a name, a callable func, optional kwargs and an
+            optional timeout in seconds.
+        max_workers (int, optional): Size of the thread pool. Defaults to one thread per source.
+        default_timeout (float, optional): Timeout in seconds for sources without their own.
+
+    Returns:
+        dict: The manifest, with the overall wall-clock time and, per source, its status
+        (ok, error or timeout), its wall-clock seconds and its result or error.
+    """
+    started_at = datetime.now()
+    started = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(sources), thread_name_prefix="extract")
+    futures = {}
+    for source in sources:
+        futures[source["name"]] = executor.submit(timed_call, source["func"], source.get("kwargs", {}))
+
+    results = {}
+    for source in sources:
+        name = source["name"]
+        deadline = started + source.get("timeout", default_timeout)
+        try:
+            results[name] = futures[name].result(timeout=max(0.0, deadline - time.perf_counter()))
+        except TimeoutError:
+            results[name] = {"status": "timeout", "seconds": round(time.perf_counter() - started, 3)}
+            logging.error(f"Extraction '{name}' timed out")
+            continue
+        if results[name]["status"] == "ok":
+            logging.info(f"Extraction '{name}' finished in {results[name]['seconds']}s")
+        else:
+            logging.error(f"Extraction '{name}' failed after {results[name]['seconds']}s: {results[name]['error']}")
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    manifest = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "sources": results,
+    }
+    logging.info(f"Extract phase finished in {manifest['wall_seconds']}s")
+    return manifest
+
+
+def save_manifest(manifest: Dict[str, Any], file_path: str) -> None:
+    """
+    Saves the extraction manifest as JSON.
+
+    Args:
+        manifest (dict): The manifest returned by run_extractions.
+        file_path (str): Path of the JSON file.
+    """
+    try:
+        with open(file_path, "w") as f:
+            json.dump(manifest, f, indent=4, default=str)
+        logging.info(f"Extraction manifest saved to {file_path}")
+    except Exception as e:
+        logging.error(f"Error saving extraction manifest: {e}")
+        raise
+
+
+def main():
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    sources = [
+        {
+            "name": "kaggle_crimes",
+            "func": download_dataset_kaggle_cached,
+            "kwargs": {"dataset_name": "AnalyzeBoston/crimes-in-boston"},
+        },
+        {
+            "name": "bostongov_shootings",
+            "func": fetch_csv_if_modified,
+            "kwargs": {
+                "url": "https://data.boston.gov/dataset/e63a37e1-be79-4722-89e6-9e7e2a3da6d1/resource/73c7e069-701f-4910-986d-b950f46c91a1/download/tmp8mntlmrz.csv",
+                "filename": os.path.join(script_dir, "ShootingsBostonGOV.csv"),
+            },
+            "timeout": 600,
+        },
+        {
+            "name": "meteostat_weather",
+            "func": fetch_weather_data_and_save,
+            "kwargs": {
+                "meteostation": "72509",
+                "file_name": "boston_weather_data.parquet",
+                "start": datetime(2013, 3, 1),
+                "end": datetime(2024, 1, 1),
+            },
+            "timeout": 600,
+        },
+    ]
+    manifest = run_extractions(sources)
+    save_manifest(manifest, os.path.join(script_dir, "extraction_manifest.json"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
+import codecs
 import csv
+import hashlib
+import json
 import logging
 import sys
 import os
 import requests
+from downloader import download_file, fetch_bytes
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
@@ -19,10 +23,7 @@ def fetch_csv_content_BostonGOV(url: str, dataset_name: str) -> bytes:
         bytes: Content of the CSV file as bytes.
     """
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-
-        return response.content
+        return fetch_bytes(url)
     except requests.exceptions.RequestException as e:
         logging.error(f"Error downloading file from URL: {e}")
         raise
@@ -72,9 +73,242 @@ def save_as_csv(data: bytes, filename: str) -> None:
         raise
 
 
-def main():
+class CsvStreamStats:
+    """
+    Accumulates a checksum, a row count and a row preview over a CSV stream
+    that arrives in byte chunks, without ever holding the whole file.
+
+    Args:
+        num_rows (int): Number of rows to keep for the preview.
+        encoding (str): Encoding of the CSV content. Defaults to "utf-8".
+    """
+
+    def __init__(self, num_rows: int = 10, encoding: str = "utf-8"):
+        self.num_rows = num_rows
+        self.encoding = encoding
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget everything seen so far, e.g. when a download restarts from byte 0."""
+        self._hash = hashlib.sha256()
+        self._decoder = codecs.getincrementaldecoder(self.encoding)()
+        self._pending = ""
+        self._record = ""
+        self._quotes = 0
+        self.header = None
+        self.preview = []
+        self.size = 0
+        self.rows = 0
+
+    def update(self, chunk: bytes) -> None:
+        """Feed the next chunk of raw bytes."""
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        self._consume(self._decoder.decode(chunk))
+
+    def finish(self) -> None:
+        """Flush the last, possibly unterminated, line."""
+        self._consume(self._decoder.decode(b"", final=True), final=True)
+        if self._record:
+            self._add_record(self._record)
+            self._record = ""
+
+    def _consume(self, text: str, final: bool = False) -> None:
+        lines = (self._pending + text).splitlines(keepends=True)
+        self._pending = ""
+        if lines and not final and not lines[-1].endswith(("\n", "\r")):
+            self._pending = lines.pop()
+        for line in lines:
+            # A record ends on a line break outside of quotes, so quoted
+            # fields spanning several lines are counted as a single row.
+            self._record += line
+            self._quotes += line.count('"')
+            if self._quotes % 2 == 0:
+                self._add_record(self._record)
+                self._record = ""
+                self._quotes = 0
+
+    def _add_record(self, record: str) -> None:
+        if not record.strip():
+            return
+        if self.header is None:
+            self.header = next(csv.reader([record]))
+            return
+        if len(self.preview) < self.num_rows:
+            self.preview.append(dict(zip(self.header, next(csv.reader([record])))))
+        self.rows += 1
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+
+def stream_csv_to_file(url: str, filename: str, num_rows: int = 10, chunk_size: int = 1 << 16) -> dict:
+    """
+    Downloads CSV content in chunks straight to disk while computing its
+    SHA-256 checksum, its row count and a preview of the first rows.
+
+    Memory use is bounded by chunk_size regardless of the size of the file.
+
+    Args:
+        url (str): The URL of the CSV file to fetch.
+        filename (str): Path of the CSV file to write.
+        num_rows (int, optional): Number of rows to preview. Defaults to 10.
+        chunk_size (int, optional): Size in bytes of the chunks read from the network.
+
+    Returns:
+        dict: path, sha256, bytes, rows and preview of the downloaded file.
+    """
+    stats = CsvStreamStats(num_rows)
+    try:
+        download_file(url, filename, sink=stats, chunk_size=chunk_size)
+        stats.finish()
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error downloading file from URL: {e}")
+        raise
+    except OSError as e:
+        logging.error(f"Error saving data as CSV file: {e}")
+        raise
+
+    logging.info(f"CSV data saved to {filename} ({stats.size} bytes, {stats.rows} rows, sha256 {stats.sha256})")
+    return {
+        "path": filename,
+        "sha256": stats.sha256,
+        "bytes": stats.size,
+        "rows": stats.rows,
+        "preview": stats.preview,
+    }
+
+
+def cache_metadata_path(filename: str) -> str:
+    """
+    Returns the path of the metadata file stored next to a cached CSV file.
+
+    Args:
+        filename (str): Path of the cached CSV file.
+
+    Returns:
+        str: Path of the JSON metadata file.
+    """
+    return filename + ".meta.json"
+
+
+def read_cache_metadata(filename: str) -> dict:
+    """
+    Reads the download metadata (ETag, Last-Modified, checksum) of a cached CSV file.
+
+    Args:
+        filename (str): Path of the cached CSV file.
+
+    Returns:
+        dict: The stored metadata, or an empty dict when the cache is missing or
+        no longer matches the file on disk.
+    """
+    meta_path = cache_metadata_path(filename)
+    try:
+        with open(meta_path, "r") as f:
+            metadata = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable cache metadata {meta_path}: {e}")
+        return {}
+    if not os.path.exists(filename) or os.path.getsize(filename) != metadata.get("bytes"):
+        return {}
+    return metadata
+
+
+def write_cache_metadata(filename: str, metadata: dict) -> None:
+    """
+    Writes the download metadata of a cached CSV file.
+
+    Args:
+        filename (str): Path of the cached CSV file.
+        metadata (dict): Metadata to store.
+    """
+    meta_path = cache_metadata_path(filename)
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(metadata, f, indent=4)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def fetch_csv_if_modified(url: str, filename: str, num_rows: int = 10, chunk_size: int = 1 << 16) -> dict:
+    """
+    Downloads CSV content only when it changed since the last download.
+
+    The ETag, Last-Modified and SHA-256 of the previous download are kept next to
+    the CSV file and sent back as If-None-Match / If-Modified-Since. A 304 answer,
+    or a body identical to the cached one, is reported as not modified. New content
+    is downloaded through downloader.download_file, so it is resumed after a dropped
+    connection and only replaces the cached file once complete.
+
+    Args:
+        url (str): The URL of the CSV file to fetch.
+        filename (str): Path of the cached CSV file.
+        num_rows (int, optional): Number of rows to preview. Defaults to 10.
+        chunk_size (int, optional): Size in bytes of the chunks read from the network.
+
+    Returns:
+        dict: The cache metadata plus path, preview and not_modified, which is True
+        when downstream tasks can be skipped.
+    """
+    cached = read_cache_metadata(filename)
+    headers = {}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    stats = CsvStreamStats(num_rows)
+    try:
+        download = download_file(url, filename, headers=headers, sink=stats, chunk_size=chunk_size)
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error downloading file from URL: {e}")
+        raise
+    if download["status"] == 304 and cached:
+        logging.info(f"{url} not modified since {cached.get('last_modified') or cached.get('etag')}")
+        return {**cached, "path": filename, "preview": [], "not_modified": True}
+    stats.finish()
+    metadata = {
+        "url": url,
+        "etag": download["etag"],
+        "last_modified": download["last_modified"],
+        "sha256": stats.sha256,
+        "bytes": stats.size,
+        "rows": stats.rows,
+    }
+
+    not_modified = bool(cached) and cached.get("sha256") == stats.sha256
+    if not_modified:
+        logging.info(f"{url} returned the cached content again (sha256 {stats.sha256})")
+    else:
+        logging.info(f"CSV data saved to {filename} ({stats.size} bytes, {stats.rows} rows, sha256 {stats.sha256})")
+    write_cache_metadata(filename, metadata)
+    return {**metadata, "path": filename, "preview": stats.preview, "not_modified": not_modified}
+
+
+def log_csv_preview(preview: list) -> None:
+    """
+    Log the rows collected by stream_csv_to_file.
+
+    Args:
+        preview (list): Rows as dictionaries keyed by the CSV header.
+    """
+    logging.info(f"Preview of the first {len(preview)} rows of the CSV file:")
+    for row in preview:
+        logging.info(row)
+
+
+def main(streaming: bool = True):
     url = "https://data.boston.gov/dataset/e63a37e1-be79-4722-89e6-9e7e2a3da6d1/resource/73c7e069-701f-4910-986d-b950f46c91a1/download/tmp8mntlmrz.csv"
     dataset_name = "SHOOTINGS_BostonGOV"
+    if streaming:
+        result = fetch_csv_if_modified(url, "ShootingsBostonGOV.csv", num_rows=10)
+        if result["not_modified"]:
+            logging.info("ShootingsBostonGOV.csv is up to date, nothing to do.")
+            return
+        log_csv_preview(result["preview"])
+        return
     file_content = fetch_csv_content_BostonGOV(url, dataset_name)
     preview_csv_content(file_content, num_rows=10)
     save_as_csv(file_content, "ShootingsBostonGOV.csv")
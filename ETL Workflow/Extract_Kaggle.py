@@ -2,13 +2,22 @@ import os
 from kaggle.api.kaggle_api_extended import KaggleApi
 from zipfile import ZipFile
 import csv
+import hashlib
+import io
+import json
 
-def download_dataset_kaggle(dataset_name):
+def download_dataset_kaggle(dataset_name, extract=True):
     """
     Downloads a dataset from Kaggle.
 
     Args:
         dataset_name (str): The name of the dataset on Kaggle.
+        extract (bool, optional): Extract crime.csv and delete the archive. When False the
+            archive is kept as is, so that crime.csv can be streamed straight out of it
+            without writing it to disk. Defaults to True.
+
+    Returns:
+        str: Path to the dataset folder, or to the zip archive when extract is False.
 
     Raises:
         Exception: If an error occurs during dataset download or extraction.
@@ -21,6 +30,11 @@ def download_dataset_kaggle(dataset_name):
         api = KaggleApi()
         api.authenticate()
         api.dataset_download_files(dataset_name, path=dataset_folder, force=True, quiet=True)  
+        zip_path = os.path.join(dataset_folder, dataset_name.split('/')[-1] + '.zip')
+
+        if not extract:
+            print("Dataset downloaded successfully.")
+            return zip_path
 
         with ZipFile(os.path.join(dataset_folder, dataset_name.split('/')[-1] + '.zip'), 'r') as zip_ref:
             zip_ref.extract('crime.csv', dataset_folder)
@@ -32,6 +46,106 @@ def download_dataset_kaggle(dataset_name):
     except Exception as e:
         print(f"An error occurred: {e}")
 
+def get_dataset_version(api, dataset_name):
+    """
+    Looks up the current version number and last-updated date of a Kaggle dataset.
+
+    Args:
+        api (KaggleApi): An authenticated Kaggle API client.
+        dataset_name (str): The name of the dataset on Kaggle, e.g. "owner/slug".
+
+    Returns:
+        dict: version and last_updated of the dataset, or an empty dict if it was not found.
+    """
+    owner, slug = dataset_name.split('/')
+    for dataset in api.dataset_list(search=slug, user=owner):
+        if str(getattr(dataset, 'ref', '')).lower() == dataset_name.lower():
+            return {
+                "version": getattr(dataset, 'currentVersionNumber', None),
+                "last_updated": str(getattr(dataset, 'lastUpdated', '')),
+            }
+    return {}
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """
+    Computes the SHA-256 checksum of a file, reading it in chunks.
+
+    Args:
+        file_path (str): Path to the file.
+        chunk_size (int, optional): Size in bytes of the chunks read. Defaults to 1 MiB.
+
+    Returns:
+        str: The hexadecimal checksum.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def download_dataset_kaggle_cached(dataset_name, member='crime.csv', cache_dir=None, api=None):
+    """
+    Returns the extracted CSV of a Kaggle dataset from a local cache, downloading the
+    archive again only when the dataset version on Kaggle changed.
+
+    The cache folder holds the extracted CSV and a manifest.json with the dataset slug,
+    its version and last-updated date, and the size and SHA-256 of the CSV.
+
+    Args:
+        dataset_name (str): The name of the dataset on Kaggle.
+        member (str, optional): Name of the CSV file inside the archive. Defaults to 'crime.csv'.
+        cache_dir (str, optional): Root of the cache. Defaults to a kaggle_cache folder next
+            to this script.
+        api (KaggleApi, optional): Kaggle API client, mainly to pass a stub in tests.
+            Defaults to a new authenticated KaggleApi.
+
+    Returns:
+        str: Path to the cached CSV file.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kaggle_cache')
+    dataset_folder = os.path.join(cache_dir, dataset_name.replace('/', '__'))
+    os.makedirs(dataset_folder, exist_ok=True)
+    csv_path = os.path.join(dataset_folder, member)
+    manifest_path = os.path.join(dataset_folder, 'manifest.json')
+
+    if api is None:
+        api = KaggleApi()
+    api.authenticate()
+    version = get_dataset_version(api, dataset_name)
+
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    if (version and manifest.get('dataset') == dataset_name and manifest.get('member') == member
+            and manifest.get('version') == version.get('version')
+            and manifest.get('last_updated') == version.get('last_updated')
+            and os.path.exists(csv_path) and os.path.getsize(csv_path) == manifest.get('size')):
+        print(f"Dataset {dataset_name} is unchanged (version {version.get('version')}), using the cached copy.")
+        return csv_path
+
+    api.dataset_download_files(dataset_name, path=dataset_folder, force=True, quiet=True)
+    zip_path = os.path.join(dataset_folder, dataset_name.split('/')[-1] + '.zip')
+    with ZipFile(zip_path, 'r') as zip_ref:
+        zip_ref.extract(member, dataset_folder)
+    os.remove(zip_path)
+
+    manifest = {
+        "dataset": dataset_name,
+        "member": member,
+        "version": version.get('version'),
+        "last_updated": version.get('last_updated'),
+        "size": os.path.getsize(csv_path),
+        "sha256": file_sha256(csv_path),
+    }
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    print(f"Dataset {dataset_name} version {version.get('version')} downloaded and cached.")
+    return csv_path
+
 def preview_csv_content(dataset_folder, num_rows=10):
     """
     Preview the content of the CSV file in the downloaded dataset.
@@ -54,6 +168,30 @@ def preview_csv_content(dataset_folder, num_rows=10):
     except Exception as e:
         print(f"An error occurred while previewing CSV content: {e}")
 
+def preview_csv_from_zip(zip_path, member='crime.csv', num_rows=10, encoding='latin-1'):
+    """
+    Preview the first rows of a CSV file inside the downloaded zip archive, reading only
+    as much of the compressed member as those rows need.
+
+    Args:
+        zip_path (str): Path to the downloaded zip archive.
+        member (str, optional): Name of the CSV file inside the archive. Defaults to 'crime.csv'.
+        num_rows (int, optional): Number of rows to preview. Defaults to 10.
+        encoding (str, optional): Encoding of the CSV file. Defaults to 'latin-1'.
+    """
+    try:
+        with ZipFile(zip_path, 'r') as zip_ref, zip_ref.open(member) as raw:
+            csv_reader = csv.reader(io.TextIOWrapper(raw, encoding=encoding, newline=''))
+            header = next(csv_reader)  # Read the header
+            print("Header:", header)
+            print(f"Preview of the first {num_rows} rows of the CSV file:")
+            for i, row in enumerate(csv_reader):
+                if i >= num_rows:
+                    break
+                print(row)
+    except Exception as e:
+        print(f"An error occurred while previewing CSV content: {e}")
+
 if __name__ == "__main__":
     dataset_name = "AnalyzeBoston/crimes-in-boston"
     dataset_folder = download_dataset_kaggle(dataset_name)
@@ -1,54 +1,294 @@
-from datetime import datetime
-from meteostat import Daily
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from meteostat import Daily, Hourly, Stations
+import json
+import logging
 import os
+import pandas as pd
 
-def fetch_weather_data_and_save(meteostation: str, file_name: str, start: datetime, end: datetime):
+def fetch_weather_data(meteostation: str, start: datetime, end: datetime) -> pd.DataFrame:
     """
-    Fetches weather data for a given meteostation, start date, and end date,
-    and saves it to an HTML file.
+    Fetches daily weather data for a given meteostation, start date, and end date.
     
     Parameters:
         meteostation (str): The ID of the meteostation.
-        file_name (str): The name of the HTML file to save the data.
         start (datetime): The start date.
         end (datetime): The end date.
+        
+    Returns:
+        pd.DataFrame: time, tavg, tmin, tmax, prcp, wdir, wspd and pres columns.
     """
     data = Daily(meteostation, start, end).fetch()
-    data = data.reset_index().iloc[:, [0, 1, 2, 3, 4, 6, 7, 9]]
+    return data.reset_index().iloc[:, [0, 1, 2, 3, 4, 6, 7, 9]]
+
+def weather_file_path(file_name: str) -> str:
+    """
+    Returns the path of a weather file in its own folder next to this script,
+    creating the folder if needed.
+    
+    Parameters:
+        file_name (str): The name of the weather file.
+        
+    Returns:
+        str: The full path of the file.
+    """
     script_dir = os.path.dirname(os.path.realpath(__file__))
     folder_path = os.path.join(script_dir, file_name.split('.')[0])
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
-    file_path = os.path.join(folder_path, file_name)
-    with open(file_path, 'w') as f:
-        f.write(data.to_html(index=False))
+    return os.path.join(folder_path, file_name)
+
+def write_weather_file(data: pd.DataFrame, file_path: str):
+    """
+    Writes weather data to a file whose format follows its extension: .parquet
+    (typed and columnar, with time stored as a date), .csv or .html.
+    
+    Parameters:
+        data (pd.DataFrame): The weather data.
+        file_path (str): Path of the file.
+    """
+    tmp_path = file_path + '.tmp'
+    if file_path.endswith('.parquet'):
+        if 'time' in data.columns:
+            data = data.assign(time=pd.to_datetime(data['time']).dt.date)
+        data.to_parquet(tmp_path, index=False, engine='pyarrow')
+    elif file_path.endswith('.csv'):
+        data.to_csv(tmp_path, index=False)
+    else:
+        with open(tmp_path, 'w') as f:
+            f.write(data.to_html(index=False))
+    os.replace(tmp_path, file_path)
+
+def read_weather_file(file_path: str) -> pd.DataFrame:
+    """
+    Reads weather data written by write_weather_file (.parquet or .csv).
+    
+    Parameters:
+        file_path (str): Path of the file.
+        
+    Returns:
+        pd.DataFrame: The weather data, with time (if any) as datetime64.
+    """
+    if file_path.endswith('.parquet'):
+        data = pd.read_parquet(file_path, engine='pyarrow')
+    else:
+        data = pd.read_csv(file_path)
+    if 'time' in data.columns:
+        data['time'] = pd.to_datetime(data['time'])
+    return data
 
-def preview_weather_data(meteostation: str, start: datetime, end: datetime, preview_limit: int = 10):
+def save_weather_data(data: pd.DataFrame, file_name: str):
+    """
+    Saves weather data to a file next to this script, as HTML, CSV or Parquet
+    depending on the extension of file_name.
+    
+    Parameters:
+        data (pd.DataFrame): The weather data.
+        file_name (str): The name of the file to save the data.
+    """
+    write_weather_file(data, weather_file_path(file_name))
+
+def fetch_weather_data_and_save(meteostation: str, file_name: str, start: datetime, end: datetime):
     """
     Fetches weather data for a given meteostation, start date, and end date,
-    and returns a preview in HTML format.
+    and saves it to an HTML, CSV or Parquet file.
+    
+    Parameters:
+        meteostation (str): The ID of the meteostation.
+        file_name (str): The name of the file to save the data; its extension selects the format.
+        start (datetime): The start date.
+        end (datetime): The end date.
+    """
+    data = fetch_weather_data(meteostation, start, end)
+    save_weather_data(data, file_name)
+
+def fetch_hourly_weather_data(meteostation: str, start: datetime, end: datetime,
+                              timezone: str = 'America/New_York') -> pd.DataFrame:
+    """
+    Fetches hourly weather data for a given meteostation, start date, and end date,
+    in a compact form: float32 measurements keyed by an int32 hour number.
+    
+    Parameters:
+        meteostation (str): The ID of the meteostation.
+        start (datetime): The start date.
+        end (datetime): The end date.
+        timezone (str): Time zone of the hours, matching the crimes' local times.
+            Defaults to 'America/New_York'.
+        
+    Returns:
+        pd.DataFrame: HOUR_KEY (hours since 1970-01-01 00:00 local time) and the temp,
+        rhum, prcp, wspd and pres columns.
+    """
+    data = Hourly(meteostation, start, end, timezone=timezone).fetch()
+    data = data[['temp', 'rhum', 'prcp', 'wspd', 'pres']].astype('float32')
+    local_time = data.index.tz_localize(None) if data.index.tz is not None else data.index
+    hour_key = (local_time - pd.Timestamp('1970-01-01')) // pd.Timedelta(hours=1)
+    data.insert(0, 'HOUR_KEY', hour_key.astype('int32'))
+    # The repeated hour when daylight saving time ends keeps its first reading.
+    return data.drop_duplicates(subset='HOUR_KEY').reset_index(drop=True)
+
+def find_nearby_stations(latitude: float, longitude: float, count: int = 3) -> pd.DataFrame:
+    """
+    Finds the meteostations closest to a point.
+    
+    Parameters:
+        latitude (float): Latitude of the point.
+        longitude (float): Longitude of the point.
+        count (int): Number of stations to return. Defaults to 3.
+        
+    Returns:
+        pd.DataFrame: station, latitude and longitude of the closest stations.
+    """
+    stations = Stations().nearby(latitude, longitude).fetch(count)
+    stations = stations.reset_index().rename(columns={'id': 'station'})
+    return stations[['station', 'latitude', 'longitude']]
+
+def fetch_weather_stations(meteostations: list, start: datetime, end: datetime, max_workers: int = 4) -> pd.DataFrame:
+    """
+    Fetches daily weather data for several meteostations in parallel.
+    
+    Parameters:
+        meteostations (list): The IDs of the meteostations.
+        start (datetime): The start date.
+        end (datetime): The end date.
+        max_workers (int): Number of concurrent requests. Defaults to 4.
+        
+    Returns:
+        pd.DataFrame: The weather data of all stations, with a trailing station column.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(lambda station: fetch_weather_data(station, start, end), meteostations))
+    for station, frame in zip(meteostations, frames):
+        frame['station'] = station
+    return pd.concat(frames, ignore_index=True)
+
+def read_weather_state(state_path: str) -> dict:
+    """
+    Reads the last date stored per meteostation.
+    
+    Parameters:
+        state_path (str): Path of the JSON state file.
+        
+    Returns:
+        dict: Last stored date (YYYY-MM-DD) keyed by meteostation ID.
+    """
+    try:
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def write_weather_state(state_path: str, state: dict):
+    """
+    Writes the last date stored per meteostation.
+    
+    Parameters:
+        state_path (str): Path of the JSON state file.
+        state (dict): Last stored date (YYYY-MM-DD) keyed by meteostation ID.
+    """
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(state_path + '.tmp', state_path)
+
+def update_weather_store(meteostation: str, store_path: str, start: datetime, end: datetime,
+                         state_path: str = None, refresh_days: int = 3) -> pd.DataFrame:
+    """
+    Brings a local weather store up to date by fetching only the days after the last
+    date already stored for the meteostation, and merging them into the store.
+    
+    The last few stored days are fetched again (refresh_days) because Meteostat
+    completes recent observations after the fact; refetched days replace the stored ones.
+    
+    Parameters:
+        meteostation (str): The ID of the meteostation.
+        store_path (str): Path of the weather store (.parquet or .csv).
+        start (datetime): The start date used when the store is empty.
+        end (datetime): The end date.
+        state_path (str): Path of the JSON state file. Defaults to weather_state.json
+            next to the store.
+        refresh_days (int): Number of already stored days to fetch again. Defaults to 3.
+        
+    Returns:
+        pd.DataFrame: The whole updated store.
+    """
+    if state_path is None:
+        state_path = os.path.join(os.path.dirname(os.path.abspath(store_path)), 'weather_state.json')
+    state = read_weather_state(state_path)
+    stored = None
+    if meteostation in state and os.path.exists(store_path):
+        stored = read_weather_file(store_path)
+        last_date = datetime.strptime(state[meteostation], '%Y-%m-%d')
+        start = max(start, last_date - timedelta(days=refresh_days - 1))
+    if start > end:
+        logging.info(f"Weather store for {meteostation} is up to date ({state.get(meteostation)}).")
+        return stored
+
+    new_data = fetch_weather_data(meteostation, start, end)
+    logging.info(f"Fetched {len(new_data)} days of weather for {meteostation} from {start:%Y-%m-%d} to {end:%Y-%m-%d}.")
+    if stored is not None:
+        new_data = pd.concat([stored, new_data], ignore_index=True)
+        new_data = new_data.drop_duplicates(subset='time', keep='last')
+    if new_data.empty:
+        return new_data
+    new_data = new_data.sort_values('time', ignore_index=True)
+
+    write_weather_file(new_data, store_path)
+    state[meteostation] = new_data['time'].max().strftime('%Y-%m-%d')
+    write_weather_state(state_path, state)
+    return new_data
+
+def preview_weather_data(meteostation: str, start: datetime, end: datetime, preview_limit: int = 10,
+                         data: pd.DataFrame = None):
+    """
+    Returns a preview in HTML format of the weather data for a given meteostation,
+    start date, and end date.
+    
+    When the data was already fetched it is passed in and reused; otherwise only the
+    first preview_limit days of the range are requested instead of the whole history.
     
     Parameters:
         meteostation (str): The ID of the meteostation.
         start (datetime): The start date.
         end (datetime): The end date.
         preview_limit (int): The maximum number of rows to include in the preview.
+        data (pd.DataFrame): Weather data already fetched for the range, if any.
         
     Returns:
         str: The HTML preview of the weather data.
     """
-    data = Daily(meteostation, start, end).fetch()
-    data = data.reset_index().iloc[:, [0, 1, 2, 3, 4, 6, 7, 9]]
+    if data is None:
+        data = fetch_weather_data(meteostation, start, min(end, start + timedelta(days=preview_limit - 1)))
     return data.head(preview_limit).to_html(index=False)
 
-def main():
+def main(incremental: bool = True, station_count: int = 1, hourly: bool = False):
     start = datetime(2013, 3, 1)
     end = datetime(2024, 1, 1)
     meteostation = "72509"
-    file_name = "boston_weather_data.html"
-    preview_html = preview_weather_data(meteostation, start, end)
+    file_name = "boston_weather_data.parquet"
+    if hourly:
+        data = fetch_hourly_weather_data(meteostation, start, end)
+        print(data.head(10).to_html(index=False))
+        save_weather_data(data, "boston_weather_hourly.parquet")
+        return
+    if station_count > 1:
+        # Stations around Boston city hall; the transform assigns each crime its nearest one.
+        stations = find_nearby_stations(42.3601, -71.0589, station_count)
+        data = fetch_weather_stations(list(stations['station']), start, end)
+        print(preview_weather_data(meteostation, start, end, data=data))
+        save_weather_data(data, file_name)
+        stations.to_parquet(weather_file_path("boston_weather_stations.parquet"), index=False)
+        return
+    if incremental:
+        end = datetime.combine(datetime.now().date(), datetime.min.time())
+        store = update_weather_store(meteostation, weather_file_path("boston_weather_store.parquet"), start, end)
+        print(preview_weather_data(meteostation, start, end, data=store))
+        save_weather_data(store, file_name)
+        return
+    # One fetch serves both the preview and the saved file.
+    data = fetch_weather_data(meteostation, start, end)
+    preview_html = preview_weather_data(meteostation, start, end, data=data)
     print(preview_html)  
-    fetch_weather_data_and_save(meteostation, file_name, start, end)
+    save_weather_data(data, file_name)
 
 if __name__ == "__main__":
     main()
@@ -2,9 +2,44 @@ import logging
 import pandas as pd
 import os
 
-def load_csv_to_dataframe(file_path: str) -> pd.DataFrame:
+from incremental import read_watermark, select_delta, write_watermark
+
+# Declared types of the shootings export: the victim attributes, the district and the flags
+# only take a handful of values, so they are read straight into categoricals.
+SHOOTINGS_SCHEMA = {
+    "incident_num": "object",
+    "district": "category",
+    "shooting_type_v2": "category",
+    "victim_gender": "category",
+    "victim_race": "category",
+    "victim_ethnicity_NIBRS": "category",
+    "multi_victim": "category",
+}
+SHOOTINGS_DATE_COLUMNS = ["shooting_date"]
+SHOOTINGS_DATE_FORMAT = "%Y-%m-%d %H:%M:%S%z"
+
+def load_csv_to_dataframe(file_path: str, schema: dict = None) -> pd.DataFrame:
+    """
+    Loads the shootings CSV file into a DataFrame.
+
+    Args:
+        file_path (str): Path to the CSV file.
+        schema (dict, optional): Column names mapped to their dtypes. When given, only these
+            columns and the shooting date are read, the date being parsed with SHOOTINGS_DATE_FORMAT.
+
+    Returns:
+        pd.DataFrame: The loaded data.
+    """
+    read_kwargs = {}
+    if schema:
+        read_kwargs = {
+            "usecols": list(schema) + SHOOTINGS_DATE_COLUMNS,
+            "dtype": schema,
+            "parse_dates": SHOOTINGS_DATE_COLUMNS,
+            "date_format": SHOOTINGS_DATE_FORMAT,
+        }
     try:
-        dataframe = pd.read_csv(file_path,encoding='latin-1')
+        dataframe = pd.read_csv(file_path,encoding='latin-1', **read_kwargs)
         return dataframe
     except Exception as e:
         logging.error(f"Error loading file: {e}")
@@ -67,20 +102,26 @@ def select_interesting_rows(df: pd.DataFrame) -> pd.DataFrame:
         logging.error(f"Error selecting rows: {e}")
         raise
 
-def save_dataframe_to_csv(df: pd.DataFrame, file_path: str) -> None:
+def save_dataframe_to_csv(df: pd.DataFrame, file_path: str, output_format: str = "csv") -> None:
     """
     Saves a pandas DataFrame to a CSV file.
 
     Args:
         df (pd.DataFrame): DataFrame to be saved.
-        output_folder (str): Path to the output folder where the CSV file will be saved.
-        file_name (str): Name of the output CSV file.
+        file_path (str): Path of the output CSV file.
+        output_format (str, optional): 'csv', or 'parquet' to write the file with a .parquet
+            extension instead, keeping the dtypes. Defaults to 'csv'.
         
     Raises:
         Exception: If saving the DataFrame to a CSV file fails.
     """
     try:
-        df.to_csv(file_path, index=False, mode='w')
+        if output_format == "parquet":
+            file_path = os.path.splitext(file_path)[0] + ".parquet"
+            df.to_parquet(file_path, index=False, compression="snappy")
+        else:
+            # Same text as bulk.py sends to COPY for the Parquet file.
+            df.to_csv(file_path, index=False, mode='w', date_format=SHOOTINGS_DATE_FORMAT)
         logging.info(f"Result has been saved to the file: {file_path}")
     except Exception as e:
         logging.error(f"Failed to save the result to CSV file: {e}")
@@ -97,6 +138,9 @@ def replace_nan_with_unknown(df: pd.DataFrame, column: list) -> pd.DataFrame:
     Returns:
         pd.DataFrame: DataFrame with NaN values replaced by 'unknown' in the specified column.
     """
+    for name in column:
+        if isinstance(df[name].dtype, pd.CategoricalDtype) and 'unknown' not in df[name].cat.categories:
+            df[name] = df[name].cat.add_categories('unknown')
     df[column] = df[column].fillna('unknown')
     return df
 
@@ -114,7 +158,7 @@ def add_primary_key(df: pd.DataFrame, column_name: str ) -> pd.DataFrame:
     df[column_name] = range(1, len(df) + 1)
     return df
 
-def main():
+def main(incremental: bool = False, output_format: str = "csv"):
     file = 'mohamed-souhail-moughel/Assignement1/ShootingsBostonGOV/ShootingsBostonGOV.csv'
     column_DICT = {
         'shooting_type_v2': 'Shooting_type',
@@ -126,11 +170,21 @@ def main():
     column_unk = ["Ethnicity", "Race", "Gender", "district"]
     output_file_path = 'output_data.csv'
     
-    df_Shot = load_csv_to_dataframe(file)
+    df_Shot = load_csv_to_dataframe(file, SHOOTINGS_SCHEMA)
+    # One row per victim: a victim is identified by the incident and its rank within it,
+    # which is also the key the load merges the shooting table on.
+    df_Shot["victim_seq"] = df_Shot.groupby("incident_num").cumcount()
+    if incremental:
+        watermark_file = 'mohamed-souhail-moughel/Assignement1/watermarks/shootings.npz'
+        watermark = read_watermark(watermark_file)
+        df_Shot, watermark = select_delta(df_Shot, ["incident_num", "victim_seq"], "shooting_date", watermark)
     df_Shot = rename_columns(df_Shot, column_DICT)
     df_Shot = convert_victims_to_boolean(df_Shot)
     df_Shot = convert_Shooting_to_boolean(df_Shot)
     df_Shot = select_interesting_rows(df_Shot)
     df_Shot=replace_nan_with_unknown(df_Shot, column_unk)
-    save_dataframe_to_csv(df_Shot, "Assignement1", "Shootings.csv")
+    output_file = "Shootings_delta.csv" if incremental else "Shootings.csv"
+    save_dataframe_to_csv(df_Shot, os.path.join('mohamed-souhail-moughel/Assignement1/Output', output_file), output_format)
+    if incremental:
+        write_watermark(watermark_file, watermark)
 
@@ -2,22 +2,161 @@
 import logging
 import sys
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-from collections import Counter
 from datetime import datetime
+from zipfile import ZipFile
+
+from incremental import assign_ids, read_watermark, select_delta, write_watermark
+from key_registry import KeyRegistry, registry_path
 
 # Logging configuration
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
+CRIME_COLUMNS = ["INCIDENT_NUMBER","OCCURRED_ON_DATE","OFFENSE_CODE","OFFENSE_CODE_GROUP","OFFENSE_DESCRIPTION","DISTRICT","REPORTING_AREA","SHOOTING","YEAR","MONTH","DAY_OF_WEEK","HOUR","UCR_PART","STREET","Lat","Long","Location"]
+OFFENSE_COLUMNS = ["OFFENSE_CODE","OFFENSE_CODE_GROUP"]
+LOCATION_COLUMNS = ["REPORTING_AREA","Lat","Long","Location"]
+DISTRICT_COLUMNS = ["DISTRICT_KEY","DISTRICT"]
+COLUMNS_TO_CLEAN = ["INCIDENT_NUMBER","Lat","Long","Location","STREET"]
+WEATHER_COLUMNS = {
+    "time":"OCCURRED_ON_DATE",
+    "tavg":"AVG_Temp",
+    "tmin":"MIN_Temp",
+    "tmax":"MAX_Temp",
+    "prcp":"Precipitation"
+}
+FACT_DROP_COLUMNS = ["YEAR","MONTH","DAY_OF_WEEK","Lat","Long","Location","DISTRICT"]
+FACT_DROP_COLUMNS_AFTER_KEY = ["wdir","OFFENSE_CODE_GROUP"]
+# Dimensions extracted from the crimes. Locations and districts only come from rows with a
+# reporting area, the rows kept in the fact table.
+DIMENSION_SPECS = [
+    {"file": "offense_data.csv", "columns": OFFENSE_COLUMNS},
+    {"file": "Location_Reporting.csv", "columns": LOCATION_COLUMNS, "require": "REPORTING_AREA"},
+    {"file": "District.csv", "columns": DISTRICT_COLUMNS, "require": "REPORTING_AREA"},
+]
+
+# Declared types of the crime.csv columns read by the transform. Repeated labels are
+# categoricals and counters are small integers; SHOOTING stays object because a chunk may
+# hold no 'Y' at all and convert_shooting_to_boolean uses the .str accessor.
+CRIME_SCHEMA = {
+    "INCIDENT_NUMBER": "object",
+    "OFFENSE_CODE": "int16",
+    "OFFENSE_CODE_GROUP": "category",
+    "OFFENSE_DESCRIPTION": "category",
+    "DISTRICT": "category",
+    "REPORTING_AREA": "category",
+    "SHOOTING": "object",
+    "YEAR": "int16",
+    "MONTH": "int8",
+    "DAY_OF_WEEK": "category",
+    "HOUR": "int8",
+    "UCR_PART": "category",
+    "STREET": "category",
+    "Lat": "float64",
+    "Long": "float64",
+    "Location": "object",
+}
+CRIME_DATE_COLUMNS = ["OCCURRED_ON_DATE"]
+CRIME_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def load_csv_to_dataframe(file_path: str, member: str = "crime.csv", **read_kwargs) -> pd.DataFrame:
+    """
+    Loads a CSV file into a DataFrame. A zip archive is read in place: the CSV member is
+    decompressed on the fly instead of being extracted to disk first.
 
-def load_csv_to_dataframe(file_path: str) -> pd.DataFrame:
+    Args:
+        file_path (str): Path to the CSV file or to a zip archive containing it.
+        member (str, optional): Name of the CSV file inside the archive. Defaults to "crime.csv".
+        **read_kwargs: Extra arguments for pd.read_csv, e.g. those of schema_read_options.
+
+    Returns:
+        pd.DataFrame: The loaded data.
+    """
+    read_kwargs.setdefault("encoding", "latin-1")
     try:
-        dataframe = pd.read_csv(file_path,encoding='latin-1')
+        if file_path.endswith(".zip"):
+            with ZipFile(file_path) as archive, archive.open(member) as f:
+                return pd.read_csv(f, **read_kwargs)
+        dataframe = pd.read_csv(file_path, **read_kwargs)
         return dataframe
     except Exception as e:
         logging.error(f"Error loading file: {e}")
         raise
 
+def iter_csv_chunks(file_path: str, chunksize: int = 100000, member: str = "crime.csv", **read_kwargs):
+    """
+    Reads a CSV file, or a CSV member of a zip archive, as a sequence of DataFrame chunks.
+
+    Args:
+        file_path (str): Path to the CSV file or to a zip archive containing it.
+        chunksize (int, optional): Number of rows per chunk. Defaults to 100000.
+        member (str, optional): Name of the CSV file inside the archive. Defaults to "crime.csv".
+        **read_kwargs: Extra arguments for pd.read_csv, e.g. usecols or dtype.
+
+    Yields:
+        pd.DataFrame: The successive chunks of the file.
+    """
+    read_kwargs.setdefault("encoding", "latin-1")
+    try:
+        if file_path.endswith(".zip"):
+            with ZipFile(file_path) as archive, archive.open(member) as f:
+                with pd.read_csv(f, chunksize=chunksize, **read_kwargs) as reader:
+                    yield from reader
+        else:
+            with pd.read_csv(file_path, chunksize=chunksize, **read_kwargs) as reader:
+                yield from reader
+    except Exception as e:
+        logging.error(f"Error loading file: {e}")
+        raise
+
+def schema_read_options(schema: dict, date_columns: list = None, date_format: str = None) -> dict:
+    """
+    Builds the pd.read_csv arguments that apply a declared schema at load time: only the
+    declared columns are parsed, each straight into its declared dtype, and the date columns
+    are parsed with a fixed format instead of being inferred row by row.
+
+    Args:
+        schema (dict): Column names mapped to their dtypes.
+        date_columns (list, optional): Columns to parse as datetimes.
+        date_format (str, optional): strftime format of the date columns.
+
+    Returns:
+        dict: Keyword arguments for pd.read_csv, load_csv_to_dataframe or iter_csv_chunks.
+    """
+    date_columns = date_columns or []
+    options = {"usecols": list(schema) + date_columns, "dtype": schema}
+    if date_columns:
+        options["parse_dates"] = date_columns
+        options["date_format"] = date_format
+    return options
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compares the memory used per column by two loads of the same data, e.g. with inferred
+    types and with the declared schema, and logs the totals.
+
+    Args:
+        before (pd.DataFrame): Data loaded with the default type inference.
+        after (pd.DataFrame): The same data loaded with the declared schema.
+
+    Returns:
+        pd.DataFrame: Per column, the dtypes and the deep memory usage in bytes before and after.
+    """
+    report = pd.DataFrame({
+        "dtype_before": before.dtypes.astype(str),
+        "bytes_before": before.memory_usage(index=False, deep=True),
+        "dtype_after": after.dtypes.astype(str),
+        "bytes_after": after.memory_usage(index=False, deep=True),
+    })
+    report["ratio"] = (report["bytes_after"] / report["bytes_before"]).round(3)
+    total_before, total_after = report["bytes_before"].sum(), report["bytes_after"].sum()
+    logging.info(f"Memory per column:\n{report.to_string()}")
+    logging.info(f"Total memory: {total_before / 2**20:.1f} MiB before, {total_after / 2**20:.1f} MiB after")
+    return report
+
 def project_columns(dataframe: pd.DataFrame, columns: list) -> pd.DataFrame:
     try:
         return dataframe[columns]
@@ -38,9 +177,33 @@ def convert_shooting_to_boolean(df: pd.DataFrame) -> pd.DataFrame:
   df['SHOOTING'] = df['SHOOTING'].fillna('N').map({'Y': 1, 'N': 0})
   return df
 
-def new_csv(df: pd.DataFrame, output_path,output_file,columns_new:list)-> None:
+def write_dataset(df: pd.DataFrame, output_path: str, output_format: str = "csv", mode: str = 'w') -> str:
+    """
+    Writes a transformed dataset. The path keeps the dataset's logical .csv name; with the
+    parquet format the file is written next to it with a .parquet extension instead, with
+    its dtypes and snappy compression, and the readers of bulk.py and the Data Cube pick it up.
+
+    Args:
+        df (pd.DataFrame): DataFrame to be saved.
+        output_path (str): Logical path of the dataset, e.g. ".../District.csv".
+        output_format (str, optional): 'csv' or 'parquet'. Defaults to 'csv'.
+        mode (str, optional): 'w' to write the file, 'a' to append rows to a CSV file. Defaults to 'w'.
+
+    Returns:
+        str: Path of the file written.
+    """
+    if output_format == "parquet":
+        if mode != 'w':
+            raise ValueError("Parquet datasets are written in one piece and cannot be appended to")
+        output_path = os.path.splitext(output_path)[0] + ".parquet"
+        df.to_parquet(output_path, index=False, compression="snappy")
+    else:
+        df.to_csv(output_path, index=False, mode=mode, header=(mode == 'w'))
+    return output_path
+
+def new_csv(df: pd.DataFrame, output_path,output_file,columns_new:list, output_format: str = "csv")-> None:
   df_new = df[columns_new].drop_duplicates(subset=columns_new[0])
-  df_new.to_csv(os.path.join(output_path,output_file), index=False)  # Saves the new DataFrame to a CSV
+  write_dataset(df_new, os.path.join(output_path,output_file), output_format)  # Saves the new DataFrame to a CSV or Parquet file
 
 def remove_slccolumn(df: pd.DataFrame, columns_ori_df:list)-> pd.DataFrame:
   if columns_ori_df:
@@ -68,24 +231,24 @@ def clean_crime_data(df: pd.DataFrame, location_cols: list) -> pd.DataFrame:
     filtered_df=filtered_df.drop_duplicates(subset="INCIDENT_NUMBER")
     return filtered_df
 
-def add_surrogate_key(df: pd.DataFrame, key_name: str = "DISTRICT_KEY", column: str = "DISTRICT") -> pd.DataFrame:
+def add_surrogate_key(df: pd.DataFrame, key_name: str = "DISTRICT_KEY", column: str = "DISTRICT",
+                      registry: KeyRegistry = None) -> pd.DataFrame:
     """
-    Adds a new column with surrogate keys, a serial number column based on the first appearance of each district,
-    and another column with the original district values, along with a mapping dictionary.
+    Adds a new column with surrogate keys, a serial number based on the first appearance of each district.
+    Keys come from a KeyRegistry, so a district keeps its key across runs and new districts get the next free one.
 
     Args:
         df (pandas.DataFrame): The DataFrame containing the column with unique values.
         key_name (str, optional): The name of the new column to store the surrogate key. Defaults to "DISTRICT_KEY".
         column (str, optional): The name of the column containing the original district values. Defaults to "DISTRICT".
+        registry (KeyRegistry, optional): Registry of the dimension's keys. Defaults to a new in-memory registry.
 
     Returns:
-        pandas.DataFrame: The DataFrame with added surrogate key, serial number, and district value columns, and a mapping dictionary.
+        pandas.DataFrame: The DataFrame with the added surrogate key column.
     """
-
-    # Create a dictionary to map unique values to surrogate keys (use Counter for frequency)
-    district_counts = Counter(df[column])
-    # Add a new column with surrogate keys based on the mapping
-    df[key_name] = df[column].map(district_counts)
+    if registry is None:
+        registry = KeyRegistry()
+    df[key_name] = registry.lookup(df[column])
 
     return df
 
@@ -114,6 +277,90 @@ def read_weather_html_file(file_path: str, index: int = 0) -> pd.DataFrame:
         print(f"Error occurred while reading HTML file: {e}")
         return None
 
+def read_weather_file(file_path: str) -> pd.DataFrame:
+    """
+    Read the weather hand-off written by Extract_Weather. Parquet files keep their dtypes
+    and the time column is returned as datetime64; HTML files go through read_weather_html_file.
+
+    Args:
+        file_path (str): Path to the weather file (.parquet, .csv or .html).
+
+    Returns:
+        pandas.DataFrame or None: The weather data, or None if it could not be read.
+    """
+    if file_path.endswith(".html"):
+        return read_weather_html_file(file_path)
+    try:
+        if file_path.endswith(".parquet"):
+            df = pd.read_parquet(file_path, engine="pyarrow")
+        else:
+            df = pd.read_csv(file_path)
+        if "time" in df.columns:
+            df["time"] = pd.to_datetime(df["time"])
+        return df
+    except Exception as e:
+        print(f"Error occurred while reading weather file: {e}")
+        return None
+
+def build_station_lookup(stations: pd.DataFrame, latitudes: pd.Series, longitudes: pd.Series,
+                         cell_size: float = 0.005) -> dict:
+    """
+    Precompute a grid over the area covered by the crimes where each cell holds the index of
+    the weather station nearest to its centre, so that stations can be assigned to crimes by
+    array indexing instead of computing distances row by row.
+
+    Args:
+        stations (pd.DataFrame): Stations with station, latitude and longitude columns.
+        latitudes (pd.Series): Latitudes of the crimes, used for the extent of the grid.
+        longitudes (pd.Series): Longitudes of the crimes, used for the extent of the grid.
+        cell_size (float, optional): Size of a cell in degrees. Defaults to 0.005 (about 500 m).
+
+    Returns:
+        dict: The grid origin, cell size, nearest-station grid and station IDs.
+    """
+    lat_min, lat_max = float(latitudes.min()), float(latitudes.max())
+    lon_min, lon_max = float(longitudes.min()), float(longitudes.max())
+    lat_centres = lat_min + (np.arange(int((lat_max - lat_min) / cell_size) + 1) + 0.5) * cell_size
+    lon_centres = lon_min + (np.arange(int((lon_max - lon_min) / cell_size) + 1) + 0.5) * cell_size
+
+    # Equirectangular distance: good enough to rank stations a few kilometres apart.
+    scale = np.cos(np.radians((lat_min + lat_max) / 2))
+    d_lat = lat_centres[:, None, None] - stations["latitude"].to_numpy()[None, None, :]
+    d_lon = (lon_centres[None, :, None] - stations["longitude"].to_numpy()[None, None, :]) * scale
+    grid = np.argmin(d_lat ** 2 + d_lon ** 2, axis=2)
+
+    return {
+        "lat_min": lat_min,
+        "lon_min": lon_min,
+        "cell_size": cell_size,
+        "grid": grid,
+        "stations": stations["station"].to_numpy(),
+    }
+
+def assign_nearest_station(df: pd.DataFrame, lookup: dict, lat_column: str = "Lat", lon_column: str = "Long",
+                           column: str = "station") -> pd.DataFrame:
+    """
+    Add a column with the weather station nearest to each crime, using a lookup built by
+    build_station_lookup. Coordinates outside the grid take the station of the nearest edge cell.
+
+    Args:
+        df (pd.DataFrame): DataFrame with latitude and longitude columns.
+        lookup (dict): The precomputed station lookup.
+        lat_column (str, optional): Name of the latitude column. Defaults to "Lat".
+        lon_column (str, optional): Name of the longitude column. Defaults to "Long".
+        column (str, optional): Name of the new column. Defaults to "station".
+
+    Returns:
+        pd.DataFrame: The DataFrame with the station column.
+    """
+    grid = lookup["grid"]
+    rows = ((df[lat_column].to_numpy(dtype=float) - lookup["lat_min"]) // lookup["cell_size"])
+    cols = ((df[lon_column].to_numpy(dtype=float) - lookup["lon_min"]) // lookup["cell_size"])
+    rows = np.clip(np.nan_to_num(rows), 0, grid.shape[0] - 1).astype(np.intp)
+    cols = np.clip(np.nan_to_num(cols), 0, grid.shape[1] - 1).astype(np.intp)
+    df[column] = lookup["stations"][grid[rows, cols]]
+    return df
+
 def rename_columns(df: pd.DataFrame, column_DICT: dict) -> pd.DataFrame:
     """
     Reads a CSV file, renames specified columns, and saves the modified DataFrame back to a CSV file.
@@ -125,16 +372,93 @@ def rename_columns(df: pd.DataFrame, column_DICT: dict) -> pd.DataFrame:
     df.rename(columns=column_DICT, inplace=True)
     return df
 
-def join_dataframes(df_weather: pd.DataFrame, df_crimes: pd.DataFrame, on: list, how: str
-) -> pd.DataFrame:
+def build_join_index(df: pd.DataFrame, on) -> pd.Index:
+    """
+    Build the index of the join key of a DataFrame, a MultiIndex when joining on several
+    columns. Building it once lets a small side be probed by many lookups.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing the key columns.
+        on (str or list): Key column or columns.
+
+    Returns:
+        pd.Index: The key of each row, in row order.
+    """
+    if isinstance(on, str):
+        return pd.Index(df[on])
+    if len(on) == 1:
+        return pd.Index(df[on[0]])
+    return pd.MultiIndex.from_frame(df[on])
+
+def lookup_join(df_small: pd.DataFrame, df_large: pd.DataFrame, on, keep_unmatched: bool = False,
+                small_first: bool = True, small_index: pd.Index = None):
+    """
+    Join a small DataFrame with unique keys onto a large one by looking up the position of
+    each large row's key in the index of the small side, then gathering the small side's
+    columns with take/reindex. Unlike a merge, no hash table is built over the large side and
+    no intermediate copies are made.
+
+    Rows and columns come out as pd.merge would put them: with small_first, the small side is
+    the left table, so inner rows are ordered by the small side's keys and kept unmatched rows
+    follow the large side (how='right'); otherwise the large side is the left table and its
+    order is kept (how='inner' or 'left').
+
+    Args:
+        df_small (pd.DataFrame): Small side, e.g. a dimension or the weather.
+        df_large (pd.DataFrame): Large side, e.g. the crimes.
+        on (str or list): Key column or columns, present in both DataFrames.
+        keep_unmatched (bool, optional): Keep the large rows without a match, with NaN in the
+            small side's columns. Defaults to False.
+        small_first (bool, optional): Put the small side's columns first. Defaults to True.
+        small_index (pd.Index, optional): Index of the small side built by build_join_index,
+            to reuse it across calls.
+
+    Returns:
+        pd.DataFrame or None: The joined DataFrame, or None when the small side's keys are not
+        unique or both sides share non-key columns, in which case a merge is needed.
+    """
+    keys = [on] if isinstance(on, str) else list(on)
+    if small_index is None:
+        small_index = build_join_index(df_small, keys)
+    shared = set(df_small.columns).intersection(df_large.columns).difference(keys)
+    if shared or not small_index.is_unique:
+        return None
+
+    positions = small_index.get_indexer(build_join_index(df_large, keys))
+    if keep_unmatched:
+        rows = np.arange(len(positions))
+    else:
+        rows = np.flatnonzero(positions >= 0)
+        if small_first:
+            rows = rows[np.argsort(positions[rows], kind="stable")]
+        positions = positions[rows]
+
+    large = df_large.take(rows).reset_index(drop=True)
+    if keep_unmatched and (positions < 0).any():
+        small = df_small.reset_index(drop=True).reindex(positions).reset_index(drop=True)
+        small[keys] = large[keys]
+    else:
+        small = df_small.take(positions).reset_index(drop=True)
+    if small_first:
+        return pd.concat([small, large.drop(columns=keys)], axis=1)
+    return pd.concat([large, small.drop(columns=keys)], axis=1)
+
+def join_dataframes(df_weather: pd.DataFrame, df_crimes: pd.DataFrame, on: list, how: str,
+                    mode: str = "merge", index: pd.Index = None) -> pd.DataFrame:
     """
     Joins two pandas DataFrames based on specified columns and method.
 
     Args:
-        odpady (pd.DataFrame): DataFrame representing waste data.
-        obyvatele (pd.DataFrame): DataFrame representing population data.
+        df_weather (pd.DataFrame): Left DataFrame, the weather.
+        df_crimes (pd.DataFrame): Right DataFrame, the crimes.
         on (list): List of column names to join on.
         how (str): Method of join ('inner', 'outer', 'left', 'right').
+        mode (str, optional): 'merge' for pd.merge, or 'lookup' to treat the left DataFrame as
+            a small side with unique keys and join it with lookup_join; 'lookup' falls back to
+            pd.merge when the keys repeat (many-to-many) or for 'left' and 'outer' joins, and
+            gives the same result either way. Defaults to 'merge'.
+        index (pd.Index, optional): Index of the left DataFrame built by build_join_index,
+            reused by the 'lookup' mode across calls.
 
     Returns:
         pd.DataFrame: Merged DataFrame.
@@ -143,13 +467,98 @@ def join_dataframes(df_weather: pd.DataFrame, df_crimes: pd.DataFrame, on: list,
         Exception: If joining data fails.
     """
     try:
-        
+        if mode == "lookup" and how in ("inner", "right"):
+            joined = lookup_join(df_weather, df_crimes, on, keep_unmatched=(how == "right"), small_index=index)
+            if joined is not None:
+                return joined
+            logging.info("Lookup join not applicable (keys not unique or shared columns), using merge")
         merged_df = pd.merge(df_weather, df_crimes, on=on, how=how)
         return merged_df
     except Exception as e:
         logging.error(f"Error joining data: {e}")
         raise
 
+def add_day_key(df: pd.DataFrame, date_column: str = "OCCURRED_ON_DATE", key_name: str = "DAY_KEY") -> pd.DataFrame:
+    """
+    Replace a datetime column by an integer day key YYYYMMDD at the same position, so that
+    crimes and weather are joined on int32 values instead of formatted date strings.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing the date column.
+        date_column (str, optional): Name of the date column. Defaults to "OCCURRED_ON_DATE".
+        key_name (str, optional): Name of the key column. Defaults to "DAY_KEY".
+
+    Returns:
+        pd.DataFrame: DataFrame with the day key in place of the date column.
+    """
+    dates = pd.to_datetime(df[date_column]).dt
+    keys = (dates.year * 10000 + dates.month * 100 + dates.day).astype(np.int32)
+    df = df.copy()
+    df[date_column] = keys
+    return df.rename(columns={date_column: key_name})
+
+def render_day_key(df: pd.DataFrame, key_name: str = "DAY_KEY", date_column: str = "OCCURRED_ON_DATE") -> pd.DataFrame:
+    """
+    Replace a day key built by add_day_key by its 'YYYY-MM-DD' date string, at the same
+    position. Each distinct day is formatted once, however many rows share it.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing the day key column.
+        key_name (str, optional): Name of the key column. Defaults to "DAY_KEY".
+        date_column (str, optional): Name of the date column. Defaults to "OCCURRED_ON_DATE".
+
+    Returns:
+        pd.DataFrame: DataFrame with the date string in place of the day key.
+    """
+    codes, days = pd.factorize(df[key_name])
+    rendered = pd.to_datetime(days.astype(str), format="%Y%m%d").strftime("%Y-%m-%d").to_numpy()
+    df[key_name] = rendered[codes] if len(codes) else []
+    return df.rename(columns={key_name: date_column})
+
+def add_hour_key(df: pd.DataFrame, date_column: str = "OCCURRED_ON_DATE", hour_column: str = "HOUR",
+                 key_name: str = "HOUR_KEY") -> pd.DataFrame:
+    """
+    Add an integer key counting the hours since 1970-01-01 00:00, built from the date and
+    HOUR columns, matching the HOUR_KEY of the hourly weather data.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing the date and hour columns.
+        date_column (str, optional): Name of the date column. Defaults to "OCCURRED_ON_DATE".
+        hour_column (str, optional): Name of the hour column. Defaults to "HOUR".
+        key_name (str, optional): Name of the new key column. Defaults to "HOUR_KEY".
+
+    Returns:
+        pd.DataFrame: DataFrame with the hour key column.
+    """
+    days = pd.to_datetime(df[date_column]).to_numpy().astype("datetime64[D]").astype(np.int64)
+    df[key_name] = (days * 24 + df[hour_column].to_numpy(dtype=np.int64)).astype(np.int32)
+    return df
+
+def join_hourly_weather(df_crimes: pd.DataFrame, df_hourly: pd.DataFrame, key: str = "HOUR_KEY",
+                        how: str = "left") -> pd.DataFrame:
+    """
+    Join hourly weather onto crimes on the (date, HOUR) key with lookup_join, which keeps the
+    join linear in the number of crimes and avoids the intermediate copies of a general merge.
+
+    Args:
+        df_crimes (pd.DataFrame): Crimes with the key column (see add_hour_key).
+        df_hourly (pd.DataFrame): Hourly weather with a unique key column.
+        key (str, optional): Name of the key column. Defaults to "HOUR_KEY".
+        how (str, optional): 'left' keeps crimes without weather (with NaN measurements),
+            'inner' drops them. Defaults to 'left'.
+
+    Returns:
+        pd.DataFrame: The crimes with the hourly weather columns appended.
+    """
+    try:
+        joined = lookup_join(df_hourly, df_crimes, key, keep_unmatched=(how == "left"), small_first=False)
+        if joined is None:
+            raise ValueError(f"Hourly weather has duplicate {key} values")
+        return joined
+    except Exception as e:
+        logging.error(f"Error joining hourly weather: {e}")
+        raise
+
 def select_interesting_rows(df: pd.DataFrame) -> pd.DataFrame:
     """
     Selects rows from a DataFrame where 'multiple_victims' column equals 1 and 'gender' column equals 'Female'.
@@ -170,7 +579,8 @@ def select_interesting_rows(df: pd.DataFrame) -> pd.DataFrame:
         logging.error(f"Error selecting rows: {e}")
         raise
 
-def save_dataframe_to_csv(df: pd.DataFrame, output_folder: str, file_name: str) -> None:
+def save_dataframe_to_csv(df: pd.DataFrame, output_folder: str, file_name: str, mode: str = 'w',
+                          output_format: str = "csv") -> None:
     """
     Saves a pandas DataFrame to a CSV file.
 
@@ -178,6 +588,10 @@ def save_dataframe_to_csv(df: pd.DataFrame, output_folder: str, file_name: str)
         df (pd.DataFrame): DataFrame to be saved.
         output_folder (str): Path to the output folder where the CSV file will be saved.
         file_name (str): Name of the output CSV file.
+        mode (str, optional): 'w' to write the file with its header, 'a' to append rows
+            without a header. Defaults to 'w'.
+        output_format (str, optional): 'csv', or 'parquet' to write file_name with a .parquet
+            extension instead (see write_dataset). Defaults to 'csv'.
         
     Raises:
         Exception: If saving the DataFrame to a CSV file fails.
@@ -192,24 +606,25 @@ def save_dataframe_to_csv(df: pd.DataFrame, output_folder: str, file_name: str)
         output_path = os.path.join(output_folder_path, file_name)
 
         # Save the DataFrame to the CSV file
-        df.to_csv(output_path, index=False, mode='w')
+        output_path = write_dataset(df, output_path, output_format, mode)
         logging.info(f"Result has been saved to the file: {output_path}")
     except Exception as e:
         logging.error(f"Failed to save the result to CSV file: {e}")
         raise
 
-def add_primary_key(df: pd.DataFrame, column_name: str ) -> pd.DataFrame:
+def add_primary_key(df: pd.DataFrame, column_name: str, start: int = 1) -> pd.DataFrame:
     """
     Add a new column with unique values acting as a primary key to the DataFrame.
 
     Args:
         df (pd.DataFrame): DataFrame containing the data.
         column_name (str): Name of the column for the primary key. Default is 'primary_key'.
+        start (int, optional): First value of the key, e.g. to continue after an earlier delta. Defaults to 1.
 
     Returns:
         pd.DataFrame: DataFrame with a new column acting as a primary key.
     """
-    df[column_name] = range(1, len(df) + 1)
+    df[column_name] = range(start, start + len(df))
     return df
 
 def drop_nan_and_empty(df: pd.DataFrame, column: str) -> pd.DataFrame:
@@ -223,7 +638,7 @@ def drop_nan_and_empty(df: pd.DataFrame, column: str) -> pd.DataFrame:
     Returns:
         pd.DataFrame: DataFrame with NaN values and empty strings dropped from the specified column.
     """
-    df[column] = df[column].replace(' ', pd.NA)
+    df[column] = df[column].mask(df[column] == ' ')
     df = df.dropna(subset=[column])
     
     return df
@@ -231,48 +646,310 @@ def drop_nan_and_empty(df: pd.DataFrame, column: str) -> pd.DataFrame:
 
 
 
-def main():
+class DimensionExtractor:
+    """
+    Extracts the distinct members of several dimensions in one pass over the crimes, whole
+    or chunk by chunk, and writes them together. For each dimension the first row seen for
+    each key is kept, as new_csv does on a whole DataFrame.
+
+    Members are identified by a 64-bit hash of their key columns, so deduplicating a chunk
+    and checking its members against the earlier chunks only compares integers, and the
+    state kept between chunks is one set of hashes per dimension.
+
+    Args:
+        specs (list): Dimension specs (see DIMENSION_SPECS): dictionaries with the output file,
+            the columns (the first one is the key unless a key is given) and optionally a
+            required column whose NaN or blank rows do not contribute members.
+    """
+
+    def __init__(self, specs: list):
+        self.specs = specs
+        self.members = {spec["file"]: [] for spec in specs}
+        self.hashes = {spec["file"]: set() for spec in specs}
+
+    def add(self, df: pd.DataFrame) -> None:
+        required = {}
+        for spec in self.specs:
+            rows = df
+            column = spec.get("require")
+            if column:
+                if column not in required:
+                    required[column] = (df[column].notna() & (df[column] != ' ')).to_numpy()
+                rows = df[required[column]]
+            key = spec.get("key", spec["columns"][:1])
+            hashes = pd.util.hash_pandas_object(rows[key], index=False).to_numpy()
+            unique_hashes, first = np.unique(hashes, return_index=True)
+            seen = self.hashes[spec["file"]]
+            new = np.fromiter((h not in seen for h in unique_hashes.tolist()), dtype=bool, count=len(unique_hashes))
+            if new.any():
+                seen.update(unique_hashes[new].tolist())
+                self.members[spec["file"]].append(rows[spec["columns"]].take(np.sort(first[new])))
+
+    def write(self, output_path: str, suffix: str = "", output_format: str = "csv") -> None:
+        file_names = []
+        for spec in self.specs:
+            members = self.members[spec["file"]]
+            df_members = pd.concat(members, ignore_index=True) if members else pd.DataFrame(columns=spec["columns"])
+            name, extension = os.path.splitext(spec["file"])
+            written = write_dataset(df_members, os.path.join(output_path, name + suffix + extension), output_format)
+            file_names.append(os.path.basename(written))
+        logging.info(f"Dimensions saved to {output_path}: {', '.join(file_names)}")
+
+def build_fact_rows(df: pd.DataFrame, df_weather: pd.DataFrame, station_lookup: dict = None,
+                    weather_index: pd.Index = None) -> pd.DataFrame:
+    """
+    Builds the rows of the crimes-weather fact table, without their Crime_ID: keys the crimes
+    by day (and nearest station), joins them with the weather, keeps the shootings and drops
+    the columns that belong to dimensions.
+
+    Args:
+        df (pd.DataFrame): Cleaned crimes with their DISTRICT_KEY.
+        df_weather (pd.DataFrame): Weather renamed with WEATHER_COLUMNS and keyed with add_day_key.
+        station_lookup (dict, optional): Lookup built by build_station_lookup when the
+            weather has one row per station and date.
+        weather_index (pd.Index, optional): Index of df_weather built by build_join_index.
+
+    Returns:
+        pd.DataFrame: The fact rows, in the column order of Crimes_weather.csv.
+    """
+    join_on = "DAY_KEY"
+    drop_columns = FACT_DROP_COLUMNS + FACT_DROP_COLUMNS_AFTER_KEY
+    df = add_day_key(df)
+    if station_lookup is not None:
+        df = assign_nearest_station(df, station_lookup)
+        join_on = ["station", "DAY_KEY"]
+        drop_columns = drop_columns + ["station"]
+    facts = join_dataframes(df_weather, df, join_on, "inner", mode="lookup", index=weather_index)
+    facts = select_interesting_rows(facts)
+    facts = remove_slccolumn(facts, drop_columns)
+    return render_day_key(facts).reset_index(drop=True)
+
+def _build_partition_facts(args: tuple) -> pd.DataFrame:
+    # Runs in a worker process; the arguments travel pickled.
+    return build_fact_rows(*args)
+
+def transform_facts_parallel(df: pd.DataFrame, df_weather: pd.DataFrame, station_lookup: dict = None,
+                             workers: int = 4, partition_by: tuple = None) -> pd.DataFrame:
+    """
+    Builds the fact rows with a pool of processes, one task per partition of the crimes
+    (by YEAR, or by YEAR and MONTH for smaller tasks). The fact rows come out of the join in
+    the weather's row order, which with several stations is not the order of the partitions,
+    so every row carries the positions of its weather row and crime row through its partition
+    and the concatenated rows are sorted back on them. The output is the serial one whatever
+    the workers and partitions, and Crime_IDs can be given afterwards without gaps.
+
+    Args:
+        df (pd.DataFrame): Cleaned crimes with their DISTRICT_KEY.
+        df_weather (pd.DataFrame): Weather renamed with WEATHER_COLUMNS and keyed with add_day_key.
+        station_lookup (dict, optional): Lookup built by build_station_lookup.
+        workers (int, optional): Number of worker processes. Defaults to 4.
+        partition_by (tuple, optional): Partition columns. Defaults to ("YEAR",).
+
+    Returns:
+        pd.DataFrame: The fact rows, as build_fact_rows returns them for the whole DataFrame.
+    """
+    partition_by = list(partition_by or ("YEAR",))
+    df = df.assign(CRIME_ROW=np.arange(len(df)))
+    df_weather = df_weather.assign(WEATHER_ROW=np.arange(len(df_weather)))
+    tasks = [(partition, df_weather, station_lookup) for _, partition in df.groupby(partition_by, sort=True)]
+    if not tasks:
+        return build_fact_rows(df, df_weather, station_lookup).drop(columns=["WEATHER_ROW", "CRIME_ROW"])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partitions = list(executor.map(_build_partition_facts, tasks))
+    facts = pd.concat(partitions, ignore_index=True)
+    facts = facts.sort_values(["WEATHER_ROW", "CRIME_ROW"], kind="stable", ignore_index=True)
+    return facts.drop(columns=["WEATHER_ROW", "CRIME_ROW"])
+
+def benchmark_parallel_transform(df: pd.DataFrame, df_weather: pd.DataFrame, station_lookup: dict = None,
+                                 max_workers: int = None, partition_by: tuple = None) -> pd.DataFrame:
+    """
+    Times the fact stage serially and with 1 to max_workers processes, checking that every
+    run gives the same rows as the serial one.
+
+    Args:
+        df (pd.DataFrame): Cleaned crimes with their DISTRICT_KEY.
+        df_weather (pd.DataFrame): Weather renamed with WEATHER_COLUMNS and keyed with add_day_key.
+        station_lookup (dict, optional): Lookup built by build_station_lookup.
+        max_workers (int, optional): Largest number of workers. Defaults to the number of CPUs.
+        partition_by (tuple, optional): Partition columns. Defaults to ("YEAR",).
+
+    Returns:
+        pd.DataFrame: Per run, the number of workers (0 for serial), seconds and speedup.
+    """
+    started = time.perf_counter()
+    expected = build_fact_rows(df, df_weather, station_lookup)
+    results = [{"workers": 0, "seconds": time.perf_counter() - started}]
+    for workers in range(1, (max_workers or os.cpu_count() or 1) + 1):
+        started = time.perf_counter()
+        facts = transform_facts_parallel(df, df_weather, station_lookup, workers, partition_by)
+        results.append({"workers": workers, "seconds": time.perf_counter() - started})
+        if not facts.equals(expected):
+            raise ValueError(f"Parallel transform with {workers} workers differs from the serial one")
+    report = pd.DataFrame(results)
+    report["speedup"] = (report["seconds"].iloc[0] / report["seconds"]).round(2)
+    logging.info(f"Fact stage by number of workers (0 = serial), partitioned by {list(partition_by or ('YEAR',))}:\n{report.to_string(index=False)}")
+    return report
+
+def transform_crimes_streaming(crimes_source: str, df_weather: pd.DataFrame, output_path: str, output_folder: str,
+                               chunksize: int = 100000, station_lookup: dict = None, registry_dir: str = None,
+                               output_format: str = "csv") -> int:
+    """
+    Runs the crimes transform chunk by chunk so that the rows held in memory are bounded by
+    chunksize. Each chunk is read with the projected columns only, then converted, cleaned,
+    joined with the weather and filtered, and its fact rows are appended to Crimes_weather.csv.
+    The dimensions of DIMENSION_SPECS are accumulated across chunks and written at the end.
 
-    list=["INCIDENT_NUMBER","OCCURRED_ON_DATE","OFFENSE_CODE","OFFENSE_CODE_GROUP","OFFENSE_DESCRIPTION","DISTRICT","REPORTING_AREA","SHOOTING","YEAR","MONTH","DAY_OF_WEEK","HOUR","UCR_PART","STREET","Lat","Long","Location"]
+    What is kept between chunks still grows with the input, though slowly: the incident
+    numbers already seen, as a sorted array of their 64-bit hashes (8 bytes per distinct
+    incident; duplicates are dropped across chunks as clean_crime_data does within one), the
+    dimension members, and the district key registry.
+
+    Args:
+        crimes_source (str): Path to crime.csv or to the Kaggle zip archive.
+        df_weather (pd.DataFrame): Weather renamed with WEATHER_COLUMNS and keyed with add_day_key.
+        output_path (str): Folder of the dimension CSV files.
+        output_folder (str): Folder containing the Output folder of the fact CSV file.
+        chunksize (int, optional): Number of input rows per chunk. Defaults to 100000.
+        station_lookup (dict, optional): Lookup built by build_station_lookup when the
+            weather has one row per station and date.
+        registry_dir (str, optional): Folder of the persistent key registries. Defaults to
+            keys that only live for this run.
+        output_format (str, optional): 'csv' or 'parquet'. A Parquet file cannot be appended
+            to, so with 'parquet' the fact rows (only the shootings) are kept and written once.
+
+    Returns:
+        int: Number of fact rows written.
+    """
+    dimensions = DimensionExtractor(DIMENSION_SPECS)
+    seen_incidents = np.empty(0, dtype=np.uint64)
+    district_keys = KeyRegistry(registry_path(registry_dir, "DISTRICT") if registry_dir else None)
+    weather_index = build_join_index(df_weather, ["station", "DAY_KEY"] if station_lookup is not None else "DAY_KEY")
+    written = 0
+    fact_parts = []
+
+    for chunk in iter_csv_chunks(crimes_source, chunksize,
+                                 **schema_read_options(CRIME_SCHEMA, CRIME_DATE_COLUMNS, CRIME_DATE_FORMAT)):
+        chunk = project_columns(chunk, CRIME_COLUMNS).copy()
+        chunk = convert_shooting_to_boolean(chunk)
+        chunk = clean_crime_data(chunk, COLUMNS_TO_CLEAN)
+        incidents = pd.util.hash_pandas_object(chunk["INCIDENT_NUMBER"], index=False).to_numpy()
+        if len(seen_incidents):
+            positions = np.minimum(np.searchsorted(seen_incidents, incidents), len(seen_incidents) - 1)
+            new = seen_incidents[positions] != incidents
+            chunk, incidents = chunk[new], incidents[new]
+        seen_incidents = np.union1d(seen_incidents, incidents)
+
+        chunk = add_surrogate_key(chunk, registry=district_keys)
+        dimensions.add(chunk)
+        chunk = drop_nan_and_empty(chunk, "REPORTING_AREA")
+
+        facts = build_fact_rows(chunk, df_weather, station_lookup, weather_index)
+        facts = add_primary_key(facts, "Crime_ID", written + 1)
+        if output_format == "parquet":
+            fact_parts.append(facts)
+        else:
+            save_dataframe_to_csv(facts, output_folder, "Crimes_weather.csv", mode='w' if written == 0 else 'a')
+        written += len(facts)
+
+    if output_format == "parquet":
+        facts = pd.concat(fact_parts, ignore_index=True) if fact_parts else pd.DataFrame()
+        save_dataframe_to_csv(facts, output_folder, "Crimes_weather.csv", output_format=output_format)
+    district_keys.save()
+    dimensions.write(output_path, output_format=output_format)
+    return written
+
+def main(hourly: bool = False, streaming: bool = False, report_memory: bool = False, incremental: bool = False,
+         workers: int = 1, partition_by: tuple = ("YEAR",), benchmark: bool = False, output_format: str = "csv"):
+
+    list=CRIME_COLUMNS
     key_name="Ditrict_ID"
     output_path='mohamed-souhail-moughel/Assignement1/crimes-in-boston' 
-    columns_newCSV1=["OFFENSE_CODE","OFFENSE_CODE_GROUP"]
-    columns_newCSV2=["REPORTING_AREA","Lat","Long","Location"]
-    columns_newCSV3=["DISTRICT_KEY","DISTRICT"]
-    columns_toclean=["INCIDENT_NUMBER","Lat","Long","Location","STREET"]
-    column_weather={
-        "time":"OCCURRED_ON_DATE",
-        "tavg":"AVG_Temp",
-        "tmin":"MIN_Temp",
-        "tmax":"MAX_Temp",
-        "prcp":"Precipitation"
-    }
-    col_inner_drop=["wdir","OFFENSE_CODE_GROUP"]
-    columns_inner_del=["YEAR","MONTH","DAY_OF_WEEK","Lat","Long","Location","DISTRICT"]
-
-    df = load_csv_to_dataframe("mohamed-souhail-moughel/Assignement1/crimes-in-boston/crime.csv")
+    columns_toclean=COLUMNS_TO_CLEAN
+    column_weather=WEATHER_COLUMNS
+    columns_inner_del=FACT_DROP_COLUMNS
+
+    # Read crime.csv straight out of the Kaggle archive when it was kept (extract=False).
+    crimes_source = "mohamed-souhail-moughel/Assignement1/crimes-in-boston/crimes-in-boston.zip"
+    if not os.path.exists(crimes_source):
+        crimes_source = "mohamed-souhail-moughel/Assignement1/crimes-in-boston/crime.csv"
+
+    registry_dir = os.path.join(output_path, "key_registry")
+    # Incremental runs only process the crimes that are new or changed since the watermark and
+    # write them to *_delta.csv files, for the loader to append or upsert.
+    watermark_file = "mohamed-souhail-moughel/Assignement1/watermarks/crimes.npz"
+    suffix = "_delta" if incremental else ""
+    if streaming and incremental:
+        raise ValueError("The incremental mode runs on the batch transform, not the streaming one")
+
+    if streaming:
+        df_weather = read_weather_file("mohamed-souhail-moughel/Assignement1/boston_weather_data/boston_weather_data.parquet")
+        df_weather = add_day_key(rename_columns(df_weather, column_weather))
+        station_lookup = None
+        if "station" in df_weather.columns:
+            df_stations = pd.read_parquet("mohamed-souhail-moughel/Assignement1/boston_weather_stations/boston_weather_stations.parquet")
+            # The crimes are not loaded up front, so the grid spans the stations plus a margin.
+            station_lookup = build_station_lookup(df_stations,
+                                                  pd.concat([df_stations["latitude"] - 0.25, df_stations["latitude"] + 0.25]),
+                                                  pd.concat([df_stations["longitude"] - 0.25, df_stations["longitude"] + 0.25]))
+        transform_crimes_streaming(crimes_source, df_weather, output_path, "mohamed-souhail-moughel/Assignement1",
+                                   station_lookup=station_lookup, registry_dir=registry_dir, output_format=output_format)
+        return
+    df = load_csv_to_dataframe(crimes_source, **schema_read_options(CRIME_SCHEMA, CRIME_DATE_COLUMNS, CRIME_DATE_FORMAT))
     df = project_columns(df, list)
+    if report_memory:
+        memory_report(project_columns(load_csv_to_dataframe(crimes_source), list), df)
     df = convert_shooting_to_boolean(df)
     df = clean_crime_data(df, columns_toclean)
-
-
-    new_csv(df, output_path, "offense_data.csv", columns_newCSV1)
+    if incremental:
+        watermark = read_watermark(watermark_file)
+        df, watermark = select_delta(df, ["INCIDENT_NUMBER"], "OCCURRED_ON_DATE", watermark)
+
+    district_keys = KeyRegistry(registry_path(registry_dir, "DISTRICT"))
+    df = add_surrogate_key(df, registry=district_keys)
+    district_keys.save()
+    dimensions = DimensionExtractor(DIMENSION_SPECS)
+    dimensions.add(df)
+    dimensions.write(output_path, suffix, output_format)
     df = drop_nan_and_empty(df, "REPORTING_AREA")
-    new_csv(df, output_path, "Location_Reporting.csv", columns_newCSV2)
-    df = add_surrogate_key(df)
-    new_csv(df, output_path, "District.csv", columns_newCSV3)
 
 
-    df_weather = read_weather_html_file("mohamed-souhail-moughel/Assignement1/boston_weather_data/boston_weather_data.html")
+    df_weather = read_weather_file("mohamed-souhail-moughel/Assignement1/boston_weather_data/boston_weather_data.parquet")
 
-    df['OCCURRED_ON_DATE'] = pd.to_datetime(df['OCCURRED_ON_DATE']).dt.strftime('%Y-%m-%d')
-    df_weather = rename_columns(df_weather, column_weather)
-    inner_join_df = join_dataframes(df_weather, df, "OCCURRED_ON_DATE", "inner")
-    inner_join_df = select_interesting_rows(inner_join_df)
-    inner_join_df = remove_slccolumn(inner_join_df, columns_inner_del)
-    inner_join_df = add_primary_key(inner_join_df, "Crime_ID")
-    inner_join_df = remove_slccolumn(inner_join_df, col_inner_drop)
-    save_dataframe_to_csv(inner_join_df, "mohamed-souhail-moughel/Assignement1", "Crimes_weather.csv")
+    if hourly:
+        df_hourly = read_weather_file("mohamed-souhail-moughel/Assignement1/boston_weather_hourly/boston_weather_hourly.parquet")
+        df_crimes_hourly = select_interesting_rows(add_hour_key(df.copy()))
+        df_crimes_hourly = join_hourly_weather(df_crimes_hourly, df_hourly, how="inner")
+        df_crimes_hourly = remove_slccolumn(df_crimes_hourly, columns_inner_del + ["OFFENSE_CODE_GROUP"])
+        if incremental:
+            df_crimes_hourly["Crime_ID"] = assign_ids(df_crimes_hourly, ["INCIDENT_NUMBER"], watermark, "hourly_ids")
+        else:
+            df_crimes_hourly = add_primary_key(df_crimes_hourly, "Crime_ID")
+        save_dataframe_to_csv(df_crimes_hourly, "mohamed-souhail-moughel/Assignement1", f"Crimes_weather_hourly{suffix}.csv",
+                              output_format=output_format)
+
+    # The dates are joined as integer day keys and only rendered back to strings for the output rows.
+    df_weather = add_day_key(rename_columns(df_weather, column_weather))
+    station_lookup = None
+    if "station" in df_weather.columns:
+        # Weather from several stations: each crime takes the one nearest to it.
+        df_stations = pd.read_parquet("mohamed-souhail-moughel/Assignement1/boston_weather_stations/boston_weather_stations.parquet")
+        station_lookup = build_station_lookup(df_stations, df["Lat"], df["Long"])
+    if benchmark:
+        benchmark_parallel_transform(df, df_weather, station_lookup, partition_by=partition_by)
+    if workers > 1:
+        inner_join_df = transform_facts_parallel(df, df_weather, station_lookup, workers, partition_by)
+    else:
+        inner_join_df = build_fact_rows(df, df_weather, station_lookup)
+    if incremental:
+        # Crimes seen in an earlier run keep their Crime_ID, new ones continue the numbering.
+        inner_join_df["Crime_ID"] = assign_ids(inner_join_df, ["INCIDENT_NUMBER"], watermark)
+    else:
+        inner_join_df = add_primary_key(inner_join_df, "Crime_ID")
+    save_dataframe_to_csv(inner_join_df, "mohamed-souhail-moughel/Assignement1", f"Crimes_weather{suffix}.csv",
+                          output_format=output_format)
+    if incremental:
+        # Advanced only once every output of the delta is written.
+        write_watermark(watermark_file, watermark)
 
 if __name__ == "__main__":
     main()
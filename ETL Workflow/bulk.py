@@ -1,14 +1,26 @@
+import csv
+import io
 import json
 import logging
+import os
+import re
 import sys
-from typing import Any, Dict
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Set
 import pandas as pd
 from psycopg2 import Error, connect
 from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from timing import timed_call
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
+# Text of the timestamps of a Parquet file in COPY, the format the transforms write to CSV
+# (SHOOTINGS_DATE_FORMAT in Transform_Shootings.py), without %z for timestamps without a zone.
+COPY_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S%z"
+
 
 def read_config_file(config_file: str) -> Dict[str, Any]:
     """
@@ -31,9 +43,26 @@ def read_config_file(config_file: str) -> Dict[str, Any]:
         raise
     return config
 
+def resolve_data_file(file_path: str) -> str:
+    """
+    Return the file holding a dataset given by its logical path, e.g. "Output/Crimes_weather.csv":
+    the Parquet file next to it when the transform wrote one at least as recent, else the path itself.
+
+    Args:
+        file_path (str): Logical path of the dataset.
+
+    Returns:
+        str: Path of the file to read.
+    """
+    parquet_path = os.path.splitext(file_path)[0] + ".parquet"
+    if parquet_path != file_path and os.path.exists(parquet_path):
+        if not os.path.exists(file_path) or os.path.getmtime(parquet_path) >= os.path.getmtime(file_path):
+            return parquet_path
+    return file_path
+
 def read_data_from_file(file_path: str) -> pd.DataFrame:
     """
-    Read data from a CSV file using Pandas.
+    Read data from a CSV file using Pandas, or from its Parquet version (see resolve_data_file).
 
     Args:
         file_path (str): Path to the CSV file.
@@ -42,7 +71,13 @@ def read_data_from_file(file_path: str) -> pd.DataFrame:
         pd.DataFrame: DataFrame containing the data.
     """
     try:
-        data_df = pd.read_csv(file_path, dtype=str)
+        file_path = resolve_data_file(file_path)
+        if file_path.endswith(".parquet"):
+            # Typed columns become Python objects and missing values None (NULL) for psycopg2.
+            data_df = pd.read_parquet(file_path)
+            data_df = data_df.astype(object).where(data_df.notna(), None)
+        else:
+            data_df = pd.read_csv(file_path, dtype=str)
     except FileNotFoundError:
         logging.error(f"File '{file_path}' not found.")
         raise
@@ -59,6 +94,7 @@ def execute_ddl(conn_params: Dict[str, Any], ddl_statement: str) -> None:
         conn_params (dict): Connection parameters for the database.
         ddl_statement (str): SQL query to create, drop or alter the table.
     """
+    conn = cur = None
     try:
         conn = connect(**conn_params)
         cur = conn.cursor()
@@ -69,9 +105,11 @@ def execute_ddl(conn_params: Dict[str, Any], ddl_statement: str) -> None:
         logging.error(f"Error altering table: {e}")
         raise
     finally:
-        cur.close()
-        conn.close()
-        
+        if cur is not None:
+            cur.close()
+        if conn is not None:
+            conn.close()
+
 def execute_insert(conn_params: Dict[str, Any], insert_query: str, data: pd.DataFrame) -> None:
     """
     Execute insertion of data into the database.
@@ -81,6 +119,7 @@ def execute_insert(conn_params: Dict[str, Any], insert_query: str, data: pd.Data
         insert_query (str): SQL query for insertion.
         data (pd.DataFrame): DataFrame containing data to be inserted.
     """
+    conn = cur = None
     try:
         conn = connect(**conn_params)
         cur = conn.cursor()
@@ -95,9 +134,627 @@ def execute_insert(conn_params: Dict[str, Any], insert_query: str, data: pd.Data
         logging.error(f"Error inserting data: {e}")
         raise
     finally:
-        cur.close()
-        conn.close()        
-        
+        if cur is not None:
+            cur.close()
+        if conn is not None:
+            conn.close()
+
+def copy_columns(header: list, column_map: Dict[str, str]) -> str:
+    """
+    Build the column list of a COPY statement from the header of the file, so that the file's
+    columns are loaded into the mapped table columns whatever their order in the file.
+
+    Args:
+        header (list): Column names of the file, in file order.
+        column_map (dict): File column names mapped to table column names.
+
+    Returns:
+        str: The table columns in file order, separated by commas.
+
+    Raises:
+        ValueError: If the file has a column that is not mapped.
+    """
+    unmapped = [column for column in header if column not in column_map]
+    if unmapped:
+        raise ValueError(f"Columns without a table column in the mapping: {unmapped}")
+    return ", ".join(column_map[column] for column in header)
+
+def file_columns(file_path: str) -> List[str]:
+    """
+    Read the column names of a transformed file, from its CSV header or Parquet schema
+    (see resolve_data_file).
+
+    Args:
+        file_path (str): Logical path of the dataset.
+
+    Returns:
+        list: The column names, in file order.
+    """
+    file_path = resolve_data_file(file_path)
+    if file_path.endswith(".parquet"):
+        import pyarrow.parquet
+
+        return pyarrow.parquet.ParquetFile(file_path).schema_arrow.names
+    with open(file_path, "r", encoding="utf-8-sig", newline="") as f:
+        return next(csv.reader(f))
+
+def format_timestamps(batch):
+    """
+    Render the timestamp columns of a Parquet record batch as text with COPY_TIMESTAMP_FORMAT,
+    to whole seconds, so that the text loaded into VARCHAR columns does not depend on the
+    format of the file.
+
+    Args:
+        batch (pyarrow.RecordBatch): The record batch.
+
+    Returns:
+        pyarrow.RecordBatch: The batch with its timestamp columns as strings.
+    """
+    import pyarrow
+    import pyarrow.compute
+
+    columns = []
+    for column in batch.columns:
+        if pyarrow.types.is_timestamp(column.type):
+            timezone = column.type.tz
+            date_format = COPY_TIMESTAMP_FORMAT if timezone else COPY_TIMESTAMP_FORMAT.replace("%z", "")
+            seconds = pyarrow.compute.cast(column, pyarrow.timestamp("s", timezone), safe=False)
+            column = pyarrow.compute.strftime(seconds, format=date_format)
+        columns.append(column)
+    return pyarrow.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+def copy_file(cur, table: str, column_map: Dict[str, str], file_path: str, batch_rows: int = 100000) -> int:
+    """
+    Stream a transformed file into a table with COPY ... FROM STDIN, without building a
+    DataFrame: a CSV file is sent as it is read from disk, and a Parquet file (see
+    resolve_data_file) is converted to CSV one record batch at a time, its timestamps
+    rendered with format_timestamps. Empty unquoted fields are loaded as NULL.
+
+    Args:
+        cur: Open psycopg2 cursor; the caller commits.
+        table (str): Name of the target table.
+        column_map (dict): File column names mapped to table column names.
+        file_path (str): Logical path of the dataset.
+        batch_rows (int, optional): Rows per record batch of a Parquet file. Defaults to 100000.
+
+    Returns:
+        int: Number of rows loaded.
+    """
+    file_path = resolve_data_file(file_path)
+    if file_path.endswith(".parquet"):
+        import pyarrow.csv
+        import pyarrow.parquet
+
+        parquet_file = pyarrow.parquet.ParquetFile(file_path)
+        columns = copy_columns(parquet_file.schema_arrow.names, column_map)
+        statement = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER false, NULL '')"
+        rows = 0
+        for batch in parquet_file.iter_batches(batch_size=batch_rows):
+            buffer = io.BytesIO()
+            pyarrow.csv.write_csv(format_timestamps(batch), buffer, pyarrow.csv.WriteOptions(include_header=False))
+            buffer.seek(0)
+            cur.copy_expert(statement, buffer)
+            rows += cur.rowcount
+        return rows
+
+    with open(file_path, "rb") as f:
+        header = next(csv.reader([f.readline().decode("utf-8-sig")]))
+        columns = copy_columns(header, column_map)
+        cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER false, NULL '')", f)
+    return cur.rowcount
+
+def execute_copy(conn_params: Dict[str, Any], table: str, column_map: Dict[str, str], file_path: str) -> Dict[str, Any]:
+    """
+    Load a transformed file into a table with COPY (see copy_file) and report the throughput.
+
+    Args:
+        conn_params (dict): Connection parameters for the database.
+        table (str): Name of the target table.
+        column_map (dict): File column names mapped to table column names.
+        file_path (str): Logical path of the dataset.
+
+    Returns:
+        dict: rows, seconds and rows_per_second.
+    """
+    try:
+        with LoadSession(conn_params) as session:
+            statement = session.copy(f"copy {table}", table, column_map, file_path)
+    except (Error, ValueError) as e:
+        logging.error(f"Error copying data into {table}: {e}")
+        raise
+    return {key: statement[key] for key in ("rows", "seconds", "rows_per_second")}
+
+def create_connection_pool(conn_params: Dict[str, Any], maxconn: int = 4) -> ThreadedConnectionPool:
+    """
+    Create a pool of database connections that load sessions can share, also across threads.
+
+    Args:
+        conn_params (dict): Connection parameters for the database.
+        maxconn (int, optional): Maximum number of open connections. Defaults to 4.
+
+    Returns:
+        ThreadedConnectionPool: The connection pool; the caller closes it with closeall().
+    """
+    return ThreadedConnectionPool(1, maxconn, **conn_params)
+
+class LoadSession:
+    """
+    Runs the statements of a load on a single connection and times each of them.
+
+    Nothing is committed until commit() is called. Used as a context manager, the session
+    commits what is left when the block ends, rolls it back if the block raises, and then
+    returns the connection to its pool (or closes it).
+
+    Args:
+        conn_params (dict, optional): Connection parameters, used when no pool is given.
+        pool (ThreadedConnectionPool, optional): Pool to take the connection from.
+    """
+
+    def __init__(self, conn_params: Dict[str, Any] = None, pool: ThreadedConnectionPool = None):
+        self.conn_params = conn_params
+        self.pool = pool
+        self.conn = None
+        self.statements = []
+        self.commits = 0
+
+    def __enter__(self) -> "LoadSession":
+        self.conn = self.pool.getconn() if self.pool is not None else connect(**self.conn_params)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            if self.pool is not None:
+                self.pool.putconn(self.conn)
+            else:
+                self.conn.close()
+            self.conn = None
+
+    def _timed(self, name: str, func, *args) -> Dict[str, Any]:
+        started = time.perf_counter()
+        with self.conn.cursor() as cur:
+            rows = func(cur, *args)
+        seconds = time.perf_counter() - started
+        rows = rows if rows is not None and rows >= 0 else None
+        statement = {"name": name, "seconds": round(seconds, 3), "rows": rows,
+                     "rows_per_second": round(rows / seconds) if rows is not None and seconds else None}
+        self.statements.append(statement)
+        logging.info(f"{name}: {statement['seconds']}s" + (f", {rows} rows ({statement['rows_per_second']} rows/s)" if rows is not None else ""))
+        return statement
+
+    def execute(self, name: str, statement: str) -> Dict[str, Any]:
+        """
+        Execute a DDL or DML statement.
+
+        Args:
+            name (str): Name of the statement in the timings, e.g. "create district".
+            statement (str): The SQL statement.
+
+        Returns:
+            dict: name, seconds, rows and rows_per_second (None for DDL).
+        """
+        def run(cur, statement):
+            cur.execute(statement)
+            return cur.rowcount
+        return self._timed(name, run, statement)
+
+    def copy(self, name: str, table: str, column_map: Dict[str, str], file_path: str) -> Dict[str, Any]:
+        """
+        Load a transformed file into a table with COPY (see copy_file).
+
+        Args:
+            name (str): Name of the statement in the timings.
+            table (str): Name of the target table.
+            column_map (dict): File column names mapped to table column names.
+            file_path (str): Logical path of the dataset.
+
+        Returns:
+            dict: name, seconds, rows and rows_per_second.
+        """
+        return self._timed(name, copy_file, table, column_map, file_path)
+
+    def insert(self, name: str, insert_query: str, data: pd.DataFrame) -> Dict[str, Any]:
+        """
+        Insert the rows of a DataFrame with execute_values.
+
+        Args:
+            name (str): Name of the statement in the timings.
+            insert_query (str): SQL query for insertion.
+            data (pd.DataFrame): DataFrame containing data to be inserted.
+
+        Returns:
+            dict: name, seconds, rows and rows_per_second.
+        """
+        def run(cur, insert_query, data):
+            execute_values(cur, insert_query, data.values)
+            return len(data)
+        return self._timed(name, run, insert_query, data)
+
+    def merge(self, name: str, table: str, column_map: Dict[str, str], file_path: str,
+              key_columns: List[str], keep_columns: List[str] = ()) -> Dict[str, Any]:
+        """
+        Merge a transformed file into a table on its natural key: the file is copied into a
+        temporary table, then INSERT ... ON CONFLICT inserts the rows with a new key and
+        updates the rows whose values differ. Rows equal to the table's are not written.
+        The target needs a unique index on key_columns.
+
+        Args:
+            name (str): Name of the statement in the timings.
+            table (str): Name of the target table.
+            column_map (dict): File column names mapped to table column names.
+            file_path (str): Logical path of the dataset.
+            key_columns (list): Table columns of the natural key.
+            keep_columns (list, optional): Table columns left as they are on updated rows,
+                e.g. a surrogate key.
+
+        Returns:
+            dict: name, seconds, rows (in the file), rows_per_second, inserted, updated and unchanged.
+
+        Raises:
+            ValueError: If the file has several rows with the same key.
+        """
+        columns = [column_map[column] for column in file_columns(file_path)]
+        fixed = {column.lower() for column in list(key_columns) + list(keep_columns)}
+        updated_columns = [column for column in columns if column.lower() not in fixed]
+        keys = ", ".join(key_columns)
+        delta = f"{table}_delta"
+        if updated_columns:
+            on_conflict = (f"DO UPDATE SET {', '.join(f'{column} = EXCLUDED.{column}' for column in updated_columns)} "
+                           f"WHERE ({', '.join(f'{table}.{column}' for column in updated_columns)}) IS DISTINCT FROM "
+                           f"({', '.join(f'EXCLUDED.{column}' for column in updated_columns)})")
+        else:
+            on_conflict = "DO NOTHING"
+
+        def run(cur):
+            cur.execute(f"DROP TABLE IF EXISTS {delta}; "
+                        f"CREATE TEMP TABLE {delta} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+            rows = copy_file(cur, delta, column_map, file_path)
+            cur.execute(f"SELECT count(*) - count(DISTINCT ({keys})) FROM {delta}")
+            duplicates = cur.fetchone()[0]
+            if duplicates:
+                raise ValueError(f"{duplicates} rows of {file_path} repeat a key ({keys}) of another row")
+            # xmax is 0 on a freshly inserted row version and set on an updated one.
+            cur.execute(f"WITH merged AS (INSERT INTO {table} ({', '.join(columns)}) "
+                        f"SELECT {', '.join(columns)} FROM {delta} ON CONFLICT ({keys}) {on_conflict} "
+                        f"RETURNING (xmax = 0) AS inserted) "
+                        f"SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged")
+            counts["inserted"], counts["updated"] = cur.fetchone()
+            cur.execute(f"DROP TABLE {delta}")
+            return rows
+
+        counts = {}
+        statement = self._timed(name, run)
+        statement.update(counts, unchanged=statement["rows"] - counts["inserted"] - counts["updated"])
+        logging.info(f"{name}: {statement['inserted']} inserted, {statement['updated']} updated, "
+                     f"{statement['unchanged']} unchanged")
+        return statement
+
+    def commit(self) -> None:
+        """
+        Commit the statements run since the last commit.
+        """
+        started = time.perf_counter()
+        self.conn.commit()
+        self.commits += 1
+        self.statements.append({"name": "commit", "seconds": round(time.perf_counter() - started, 3), "rows": None,
+                                "rows_per_second": None})
+
+def table_load_steps(table: str, drop_query: str, create_query: str, column_map: Dict[str, str],
+                     file_path: str, after: List[str] = ()) -> List[Dict[str, Any]]:
+    """
+    Build the steps that rebuild one table: drop, create, COPY the file, then the statements
+    in after (e.g. constraints). The steps share the table name as their transaction group,
+    and the drop step is marked with phase "drop" for run_load_schedule.
+
+    Args:
+        table (str): Name of the table.
+        drop_query (str): Statement dropping the table.
+        create_query (str): Statement creating the table.
+        column_map (dict): File column names mapped to table column names.
+        file_path (str): Logical path of the dataset.
+        after (list, optional): Statements to run once the table is loaded.
+
+    Returns:
+        list: The steps, for run_load_plan.
+    """
+    steps = [
+        {"name": f"drop {table}", "group": table, "phase": "drop", "sql": drop_query},
+        {"name": f"create {table}", "group": table, "sql": create_query},
+        {"name": f"copy {table}", "group": table, "copy": (table, column_map, file_path)},
+    ]
+    for number, statement in enumerate(after, start=1):
+        steps.append({"name": f"after {table} #{number}", "group": table, "sql": statement})
+    return steps
+
+def merge_table_steps(table: str, create_query: str, column_map: Dict[str, str], file_path: str,
+                      key_columns: List[str], keep_columns: List[str] = ()) -> List[Dict[str, Any]]:
+    """
+    Build the steps that merge a file into one table instead of rebuilding it: create the
+    table if it does not exist, add a unique index on the natural key unless the key is the
+    table's primary key, then merge the file (see LoadSession.merge). The steps share the
+    table name as their transaction group.
+
+    Args:
+        table (str): Name of the table.
+        create_query (str): CREATE TABLE statement of the table.
+        column_map (dict): File column names mapped to table column names.
+        file_path (str): Logical path of the dataset, e.g. a delta written by an incremental run.
+        key_columns (list): Table columns of the natural key.
+        keep_columns (list, optional): Table columns left as they are on updated rows.
+
+    Returns:
+        list: The steps, for run_load_plan or run_load_schedule.
+    """
+    create_if_missing = re.sub(r"CREATE\s+TABLE", "CREATE TABLE IF NOT EXISTS", create_query, count=1, flags=re.IGNORECASE)
+    steps = [{"name": f"create {table}", "group": table, "sql": create_if_missing}]
+    _, primary_keys, _ = defer_constraints(create_query)
+    keys = ", ".join(key_columns)
+    if f"ALTER TABLE {table} ADD PRIMARY KEY ({keys})".lower() not in [query.lower() for query in primary_keys]:
+        steps.append({"name": f"merge key {table}", "group": table,
+                      "sql": f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_merge_key ON {table} ({keys})"})
+    steps.append({"name": f"merge {table}", "group": table,
+                  "merge": (table, column_map, file_path, list(key_columns), list(keep_columns))})
+    return steps
+
+def run_load_plan(conn_params: Dict[str, Any], plan: List[Dict[str, Any]], transaction: str = "plan",
+                  pool: ThreadedConnectionPool = None) -> Dict[str, Any]:
+    """
+    Run a load plan on a single connection, instead of one connection and one commit per
+    statement as execute_ddl and execute_insert do.
+
+    A step is a dictionary with a name, an optional transaction group, and one of sql (a
+    statement), copy (a (table, column_map, file_path) tuple for COPY), merge (a (table,
+    column_map, file_path, key_columns, keep_columns) tuple, see LoadSession.merge) or
+    insert (an (insert_query, file_path) tuple for execute_values). transaction sets when to commit:
+    "plan" runs the whole plan in one transaction, so a failure leaves the database as it
+    was; "group" commits each time the group changes between consecutive steps; "step"
+    commits after every step. A failure rolls back the open transaction only.
+
+    Args:
+        conn_params (dict): Connection parameters for the database.
+        plan (list): The steps, in order.
+        transaction (str, optional): "plan", "group" or "step". Defaults to "plan".
+        pool (ThreadedConnectionPool, optional): Pool to take the connection from.
+
+    Returns:
+        dict: wall_seconds, commits and the timings of each statement (name, seconds, rows).
+    """
+    if transaction not in ("plan", "group", "step"):
+        raise ValueError(f"Unknown transaction mode: {transaction}")
+    started = time.perf_counter()
+    session = LoadSession(conn_params, pool)
+    current = "connect"
+    try:
+        with session:
+            for position, step in enumerate(plan):
+                current = step["name"]
+                if "sql" in step:
+                    session.execute(step["name"], step["sql"])
+                elif "copy" in step:
+                    session.copy(step["name"], *step["copy"])
+                elif "merge" in step:
+                    session.merge(step["name"], *step["merge"])
+                else:
+                    insert_query, file_path = step["insert"]
+                    session.insert(step["name"], insert_query, read_data_from_file(file_path))
+                last = position == len(plan) - 1
+                if not last and (transaction == "step"
+                                 or transaction == "group" and step.get("group") != plan[position + 1].get("group")):
+                    session.commit()
+    except (Error, ValueError, OSError) as e:
+        logging.error(f"Error running load plan at step '{current}': {e}")
+        raise
+    report = {"wall_seconds": round(time.perf_counter() - started, 3), "commits": session.commits,
+              "statements": session.statements}
+    logging.info(f"Load plan finished in {report['wall_seconds']}s with {report['commits']} commits")
+    return report
+
+def foreign_key_dependencies(create_queries: List[str]) -> Dict[str, Set[str]]:
+    """
+    Read the tables each table references from the FOREIGN KEY ... REFERENCES clauses of
+    its CREATE TABLE statement.
+
+    Args:
+        create_queries (list): CREATE TABLE statements, e.g. those of DimRegionsQueries.
+
+    Returns:
+        dict: Table name mapped to the set of tables it references, names in lower case.
+    """
+    dependencies = {}
+    for query in create_queries:
+        table = re.search(r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", query, re.IGNORECASE).group(1).lower()
+        referenced = re.findall(r"REFERENCES\s+(\w+)", query, re.IGNORECASE)
+        dependencies[table] = {name.lower() for name in referenced} - {table}
+    return dependencies
+
+def load_order(tables: Dict[str, Any], dependencies: Dict[str, Set[str]]) -> List[str]:
+    """
+    Order tables so that each comes after the tables it references.
+
+    Args:
+        tables (dict): Table names (the keys are used).
+        dependencies (dict): Table name mapped to the tables it references.
+
+    Returns:
+        list: The table names, referenced tables first.
+
+    Raises:
+        ValueError: If the dependencies contain a cycle.
+    """
+    remaining = {table: dependencies.get(table, set()) & set(tables) for table in tables}
+    order = []
+    while remaining:
+        ready = sorted(table for table, referenced in remaining.items() if not referenced & set(remaining))
+        if not ready:
+            raise ValueError(f"Cyclic foreign keys between tables: {sorted(remaining)}")
+        order += ready
+        for table in ready:
+            del remaining[table]
+    return order
+
+def run_load_schedule(conn_params: Dict[str, Any], tables: Dict[str, List[Dict[str, Any]]],
+                      dependencies: Dict[str, Set[str]], max_workers: int = 4) -> Dict[str, Any]:
+    """
+    Load tables concurrently, each on its own pooled connection, starting a table only once
+    the tables it references are committed.
+
+    The drop steps (phase "drop") of all tables run first in one transaction, referencing
+    tables before referenced ones: dropping a dimension with CASCADE while the fact table
+    still exists would lock the fact table and make the dimension loads wait on each other.
+    Each table's other steps then run as one transaction with run_load_plan. A table whose
+    referenced table failed is skipped. References to tables outside the schedule are taken
+    as already loaded.
+
+    Args:
+        conn_params (dict): Connection parameters for the database.
+        tables (dict): Table name mapped to its steps, e.g. from table_load_steps.
+        dependencies (dict): Table name mapped to the tables it references, e.g. from
+            foreign_key_dependencies.
+        max_workers (int, optional): Number of tables loaded at the same time. Defaults to 4.
+
+    Returns:
+        dict: wall_seconds and, per table, its status (ok, error or skipped), its wall-clock
+        seconds and its load report or error.
+
+    Raises:
+        ValueError: If the dependencies contain a cycle.
+        RuntimeError: If a table failed or was skipped.
+    """
+    started = time.perf_counter()
+    order = load_order(tables, dependencies)
+    waiting = {table: dependencies.get(table, set()) & set(tables) for table in tables}
+    drops = [step for table in reversed(order) for step in tables[table] if step.get("phase") == "drop"]
+    pool = create_connection_pool(conn_params, maxconn=max_workers)
+    results = {}
+    try:
+        if drops:
+            run_load_plan(conn_params, drops, pool=pool)
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="load")
+        running = {}
+        while waiting or running:
+            for table in [table for table, referenced in waiting.items() if not referenced & (set(waiting) | set(running.values()))]:
+                del waiting[table]
+                failed = [name for name in dependencies.get(table, ()) if results.get(name, {}).get("status", "ok") != "ok"]
+                if failed:
+                    results[table] = {"status": "skipped", "error": f"referenced tables failed: {failed}"}
+                    logging.error(f"Load of {table} skipped, referenced tables failed: {failed}")
+                    continue
+                steps = [step for step in tables[table] if step.get("phase") != "drop"]
+                running[executor.submit(timed_call, run_load_plan, {"conn_params": conn_params, "plan": steps, "pool": pool})] = table
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                table = running.pop(future)
+                results[table] = future.result()
+                if results[table]["status"] == "ok":
+                    logging.info(f"Loaded {table} in {results[table]['seconds']}s")
+                else:
+                    logging.error(f"Load of {table} failed after {results[table]['seconds']}s: {results[table]['error']}")
+        executor.shutdown()
+    finally:
+        pool.closeall()
+
+    manifest = {"wall_seconds": round(time.perf_counter() - started, 3), "tables": results}
+    logging.info(f"Load schedule finished in {manifest['wall_seconds']}s")
+    failed = sorted(table for table, result in results.items() if result["status"] != "ok")
+    if failed:
+        raise RuntimeError(f"Tables not loaded: {failed}")
+    return manifest
+
+def defer_constraints(create_query: str):
+    """
+    Split a CREATE TABLE statement into an UNLOGGED table without keys and the statements
+    adding its keys back: the inline PRIMARY KEY of a column and the table's FOREIGN KEY
+    clauses. The keys keep PostgreSQL's default names.
+
+    Args:
+        create_query (str): CREATE TABLE statement, e.g. from DimRegionsQueries.
+
+    Returns:
+        tuple: The CREATE UNLOGGED TABLE statement, the ADD PRIMARY KEY statements and the
+        ADD FOREIGN KEY statements.
+    """
+    table = re.search(r"CREATE\s+TABLE\s+(\w+)", create_query, re.IGNORECASE).group(1)
+    primary_keys = [f"ALTER TABLE {table} ADD PRIMARY KEY ({column})"
+                    for column in re.findall(r"(\w+)\s+[^,(]*?(?:\(\d+\))?\s*PRIMARY\s+KEY", create_query, re.IGNORECASE)]
+    foreign_keys = [f"ALTER TABLE {table} ADD FOREIGN KEY ({columns}) REFERENCES {referenced}({referenced_columns})"
+                    for columns, referenced, referenced_columns in re.findall(
+                        r"FOREIGN\s+KEY\s*\(([^)]*)\)\s*REFERENCES\s+(\w+)\s*\(([^)]*)\)", create_query, re.IGNORECASE)]
+    query = re.sub(r",\s*FOREIGN\s+KEY\s*\([^)]*\)\s*REFERENCES\s+\w+\s*\([^)]*\)", "", create_query, flags=re.IGNORECASE)
+    query = re.sub(r"\s+PRIMARY\s+KEY", "", query, flags=re.IGNORECASE)
+    query = re.sub(r"CREATE\s+TABLE", "CREATE UNLOGGED TABLE", query, count=1, flags=re.IGNORECASE)
+    return query, primary_keys, foreign_keys
+
+def staged_table_steps(table: str, create_query: str, column_map: Dict[str, str], file_path: str,
+                       after: List[str] = (), schema: str = "public", staging_schema: str = "staging") -> List[Dict[str, Any]]:
+    """
+    Build the steps that rebuild one table in the staging schema: create it UNLOGGED and
+    without keys, COPY the file, add the primary keys, run the statements in after, add the
+    foreign keys, and SET LOGGED. The steps run with the staging schema first on the
+    search_path, so the statements of DimRegionsQueries apply to the staging tables as they
+    are and foreign keys reference the staging version of a table when there is one.
+
+    Args:
+        table (str): Name of the table.
+        create_query (str): CREATE TABLE statement of the table (see defer_constraints).
+        column_map (dict): File column names mapped to table column names.
+        file_path (str): Logical path of the dataset.
+        after (list, optional): Statements to run once the table is loaded, e.g. constraints.
+        schema (str, optional): Schema of the live tables. Defaults to "public".
+        staging_schema (str, optional): Schema of the staging tables. Defaults to "staging".
+
+    Returns:
+        list: The steps, for run_staged_load.
+    """
+    create_unlogged, primary_keys, foreign_keys = defer_constraints(create_query)
+    steps = [
+        {"name": f"drop staging {table}", "group": table, "phase": "drop",
+         "sql": f"CREATE SCHEMA IF NOT EXISTS {staging_schema}; DROP TABLE IF EXISTS {staging_schema}.{table} CASCADE"},
+        {"name": f"search_path {table}", "group": table, "sql": f"SET LOCAL search_path TO {staging_schema}, {schema}"},
+        {"name": f"create staging {table}", "group": table, "sql": create_unlogged},
+        {"name": f"copy {table}", "group": table, "copy": (table, column_map, file_path)},
+    ]
+    for number, statement in enumerate(primary_keys + list(after) + foreign_keys, start=1):
+        steps.append({"name": f"constraint {table} #{number}", "group": table, "sql": statement})
+    steps.append({"name": f"set logged {table}", "group": table, "sql": f"ALTER TABLE {table} SET LOGGED"})
+    return steps
+
+def run_staged_load(conn_params: Dict[str, Any], tables: Dict[str, List[Dict[str, Any]]],
+                    dependencies: Dict[str, Set[str]], max_workers: int = 4, schema: str = "public",
+                    staging_schema: str = "staging") -> Dict[str, Any]:
+    """
+    Rebuild tables in a staging schema and swap them into place in one transaction.
+
+    The staging tables are built with run_load_schedule (see staged_table_steps): rows are
+    copied into UNLOGGED tables without keys, so no index or foreign key is maintained row
+    by row, and the keys are then built in bulk. Readers keep seeing the live tables until
+    the swap, which drops them and moves the staging tables, with their keys and sequences,
+    into the live schema. If a table fails to build, nothing is swapped.
+
+    Args:
+        conn_params (dict): Connection parameters for the database.
+        tables (dict): Table name mapped to its steps, from staged_table_steps.
+        dependencies (dict): Table name mapped to the tables it references.
+        max_workers (int, optional): Number of tables built at the same time. Defaults to 4.
+        schema (str, optional): Schema of the live tables. Defaults to "public".
+        staging_schema (str, optional): Schema of the staging tables. Defaults to "staging".
+
+    Returns:
+        dict: The manifest of run_load_schedule, with the report of the swap under "swap".
+    """
+    order = load_order(tables, dependencies)
+    manifest = run_load_schedule(conn_params, tables, dependencies, max_workers=max_workers)
+    swap = [{"name": f"drop {table}", "sql": f"DROP TABLE IF EXISTS {schema}.{table} CASCADE"} for table in reversed(order)]
+    swap += [{"name": f"swap {table}", "sql": f"ALTER TABLE {staging_schema}.{table} SET SCHEMA {schema}"} for table in order]
+    manifest["swap"] = run_load_plan(conn_params, swap)
+    logging.info(f"Swapped {len(order)} staged tables into {schema}")
+    return manifest
+
 class DimRegionsQueries:
     """
     Contains SQL queries related to the dim_regions table.
@@ -129,7 +786,8 @@ class DimRegionsQueries:
     Gender VARCHAR(100),
     Race VARCHAR(100),
     Ethnicity VARCHAR(100),
-    multiple_victims INTEGER
+    multiple_victims INTEGER,
+    victim_seq INTEGER
     );
     """
     create_table_district_query = """
@@ -198,7 +856,7 @@ class DimRegionsQueries:
     VALUES %s;
     """
     insert_shootings_query = """
-    INSERT INTO shooting (incident_num, shooting_date, district,Shooting_type,Gender,Race,Ethnicity,multiple_victims)
+    INSERT INTO shooting (incident_num, shooting_date, district,Shooting_type,Gender,Race,Ethnicity,multiple_victims,victim_seq)
     VALUES %s;
     """
     insert_district_query = """
@@ -213,35 +871,93 @@ class DimRegionsQueries:
     INSERT INTO location (reporting_area,Lat,Long,Location)
     VALUES %s;
     """
+    # File columns mapped to table columns, for the COPY loader.
+    copy_crimes_weather_columns = {
+        "OCCURRED_ON_DATE": "Occurred_on_date",
+        "AVG_Temp": "AVG_Temp",
+        "MIN_Temp": "MIN_Temp",
+        "MAX_Temp": "MAX_Temp",
+        "Precipitation": "Precipitation",
+        "wspd": "wspd",
+        "pres": "pres",
+        "INCIDENT_NUMBER": "INCIDENT_NUMBER",
+        "OFFENSE_CODE": "OFFENSE_CODE",
+        "OFFENSE_DESCRIPTION": "OFFENSE_DESCRIPTION",
+        "REPORTING_AREA": "REPORTING_AREA",
+        "SHOOTING": "SHOOTING",
+        "HOUR": "HOUR",
+        "UCR_PART": "UCR_PART",
+        "STREET": "STREET",
+        "DISTRICT_KEY": "DISTRICT_KEY",
+        "Crime_ID": "CRIME_ID",
+    }
+    copy_shootings_columns = {
+        "incident_num": "incident_num",
+        "shooting_date": "shooting_date",
+        "district": "district",
+        "Shooting_type": "Shooting_type",
+        "Gender": "Gender",
+        "Race": "Race",
+        "Ethnicity": "Ethnicity",
+        "multiple_victims": "multiple_victims",
+        "victim_seq": "victim_seq",
+    }
+    copy_district_columns = {"DISTRICT_KEY": "district_key", "DISTRICT": "district"}
+    copy_offense_columns = {"OFFENSE_CODE": "offense_code", "OFFENSE_CODE_GROUP": "offense_code_group"}
+    copy_location_columns = {"REPORTING_AREA": "reporting_area", "Lat": "Lat", "Long": "Long", "Location": "Location"}
+
+    # Natural keys of the tables for the merge load, and the columns an update leaves alone.
+    # The shooting file has one row per victim, told apart by their rank within the incident.
+    merge_keys = {
+        "shooting": (["incident_num", "victim_seq"], ["incident_ID"]),
+        "district": (["district_key"], []),
+        "offense": (["offense_code"], []),
+        "location": (["reporting_area"], []),
+        "crimes_weather": (["INCIDENT_NUMBER"], ["CRIME_ID"]),
+    }
+
     alter_shooting_query = """
     ALTER TABLE shooting
     ADD CONSTRAINT incident_pk PRIMARY KEY (incident_ID);
     """
 
 
-def main():
+def main(staged=False, merge=False):
+    if staged and merge:
+        raise ValueError("The staged load rebuilds the tables, it cannot merge into them")
     conn_params=read_config_file("mohamed-souhail-moughel/ETL Workflow/connection.json")
-    data_Shootings = read_data_from_file("mohamed-souhail-moughel/ETL Workflow/Shootings.csv")
-    execute_ddl(conn_params, DimRegionsQueries.drop_table_Shootings_query)
-    execute_ddl(conn_params, DimRegionsQueries.create_table_Shootings_query)
-    execute_insert(conn_params, DimRegionsQueries.insert_shootings_query, data_Shootings)
-    execute_ddl(conn_params, DimRegionsQueries.alter_shooting_query)
-    """data_district = read_data_from_file("Assignement1/crimes-in-boston/District.csv")
-    execute_ddl(conn_params, DimRegionsQueries.drop_table_district_query)
-    execute_ddl(conn_params, DimRegionsQueries.create_table_district_query)
-    execute_insert(conn_params, DimRegionsQueries.insert_district_query, data_district)
-    data_offense = read_data_from_file("Assignement1/crimes-in-boston/offense_data.csv")
-    execute_ddl(conn_params, DimRegionsQueries.drop_table_offense_query)
-    execute_ddl(conn_params, DimRegionsQueries.create_table_offense_query)
-    execute_insert(conn_params, DimRegionsQueries.insert_offense_query, data_offense)
-    data_location = read_data_from_file("Assignement1/crimes-in-boston/Location_Reporting.csv")
-    execute_ddl(conn_params, DimRegionsQueries.drop_table_location_query)
-    execute_ddl(conn_params, DimRegionsQueries.create_table_location_query)
-    execute_insert(conn_params, DimRegionsQueries.insert_location_query, data_location)
-    data_crimes_weather = read_data_from_file("Assignement1/Output/Crimes_weather.csv")
-    execute_ddl(conn_params, DimRegionsQueries.drop_table_crimes_weather_query)
-    execute_ddl(conn_params, DimRegionsQueries.create_table_crimes_weather_query)
-    execute_insert(conn_params, DimRegionsQueries.insert_crimes_weather_query, data_crimes_weather)"""
+    crimes_folder = "mohamed-souhail-moughel/Assignement1/crimes-in-boston"
+    output_folder = "mohamed-souhail-moughel/Assignement1/Output"
+    # Table: drop and create statements, file columns mapped to table columns, file, statements after the load.
+    sources = {
+        "shooting": (DimRegionsQueries.drop_table_Shootings_query, DimRegionsQueries.create_table_Shootings_query,
+                     DimRegionsQueries.copy_shootings_columns, os.path.join(output_folder, "Shootings.csv"),
+                     [DimRegionsQueries.alter_shooting_query]),
+        "district": (DimRegionsQueries.drop_table_district_query, DimRegionsQueries.create_table_district_query,
+                     DimRegionsQueries.copy_district_columns, os.path.join(crimes_folder, "District.csv"), []),
+        "offense": (DimRegionsQueries.drop_table_offense_query, DimRegionsQueries.create_table_offense_query,
+                    DimRegionsQueries.copy_offense_columns, os.path.join(crimes_folder, "offense_data.csv"), []),
+        "location": (DimRegionsQueries.drop_table_location_query, DimRegionsQueries.create_table_location_query,
+                     DimRegionsQueries.copy_location_columns, os.path.join(crimes_folder, "Location_Reporting.csv"), []),
+        "crimes_weather": (DimRegionsQueries.drop_table_crimes_weather_query, DimRegionsQueries.create_table_crimes_weather_query,
+                           DimRegionsQueries.copy_crimes_weather_columns, os.path.join(output_folder, "Crimes_weather.csv"), []),
+    }
+    dependencies = foreign_key_dependencies([DimRegionsQueries.create_table_crimes_weather_query])
+    if staged:
+        # Full rebuild: load staging copies without keys, then swap them in (see run_staged_load).
+        tables = {table: staged_table_steps(table, create, columns, file_path, after=after)
+                  for table, (drop, create, columns, file_path, after) in sources.items()}
+        run_staged_load(conn_params, tables, dependencies)
+        return
+    tables = {table: table_load_steps(table, drop, create, columns, file_path, after=after)
+              for table, (drop, create, columns, file_path, after) in sources.items()}
+    if merge:
+        # Daily load: merge the *_delta files of an incremental transform into the existing tables.
+        for table, (keys, keep) in DimRegionsQueries.merge_keys.items():
+            drop, create, columns, file_path, after = sources[table]
+            delta_path = os.path.splitext(file_path)[0] + "_delta.csv"
+            tables[table] = merge_table_steps(table, create, columns, delta_path, keys, keep)
+    run_load_schedule(conn_params, tables, dependencies)
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,272 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def create_session(pool_connections: int = 4, pool_maxsize: int = 8) -> requests.Session:
+    """
+    Creates a requests Session with a connection pool mounted for http and https.
+
+    Args:
+        pool_connections (int, optional): Number of host pools to cache. Defaults to 4.
+        pool_maxsize (int, optional): Maximum number of connections kept per host. Defaults to 8.
+
+    Returns:
+        requests.Session: The pooled session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the pooled session shared by all extractors of the process.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def backoff_delay(attempt: int, backoff: float, max_backoff: float) -> float:
+    """
+    Computes the exponential backoff delay (with a little jitter) before a retry.
+
+    Args:
+        attempt (int): Number of the failed attempt, starting at 0.
+        backoff (float): Base delay in seconds.
+        max_backoff (float): Upper bound of the delay in seconds.
+
+    Returns:
+        float: Delay in seconds.
+    """
+    return min(max_backoff, backoff * (2 ** attempt)) + random.uniform(0, backoff)
+
+
+def fetch_bytes(url: str, session: Optional[requests.Session] = None, retries: int = 5,
+                backoff: float = 0.5, max_backoff: float = 30.0, timeout: Any = (10, 60)) -> bytes:
+    """
+    Fetches a small resource in memory, retrying transient failures.
+
+    Args:
+        url (str): The URL to fetch.
+        session (requests.Session, optional): Session to use. Defaults to the shared pooled session.
+        retries (int, optional): Number of retries after the first attempt. Defaults to 5.
+        backoff (float, optional): Base backoff delay in seconds. Defaults to 0.5.
+        max_backoff (float, optional): Maximum backoff delay in seconds. Defaults to 30.
+        timeout (optional): Connect and read timeouts passed to requests.
+
+    Returns:
+        bytes: The response body.
+    """
+    session = session or get_session()
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(url, timeout=timeout)
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt < retries:
+                raise requests.exceptions.HTTPError(f"{response.status_code} from {url}", response=response)
+            response.raise_for_status()
+            return response.content
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError, requests.exceptions.HTTPError) as e:
+            if attempt >= retries or not _is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, backoff, max_backoff)
+            logging.warning(f"Fetching {url} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in RETRYABLE_STATUS_CODES
+    return True
+
+
+def _read_checkpoint(part_filename: str, url: str) -> Dict[str, Any]:
+    checkpoint_path = part_filename + ".json"
+    try:
+        with open(checkpoint_path, "r") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if checkpoint.get("url") != url or not os.path.exists(part_filename):
+        return {}
+    return checkpoint
+
+
+def _write_checkpoint(part_filename: str, checkpoint: Dict[str, Any]) -> None:
+    with open(part_filename + ".json", "w") as f:
+        json.dump(checkpoint, f)
+
+
+def _discard_partial(part_filename: str) -> None:
+    for path in (part_filename, part_filename + ".json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _replay_partial(part_filename: str, sink: Any, chunk_size: int) -> None:
+    # Partial content left by an earlier process has not been seen by this sink yet.
+    with open(part_filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sink.update(chunk)
+
+
+def download_file(url: str, filename: str, session: Optional[requests.Session] = None,
+                  headers: Optional[Dict[str, str]] = None, sink: Any = None, retries: int = 5,
+                  backoff: float = 0.5, max_backoff: float = 30.0, chunk_size: int = 1 << 16,
+                  timeout: Any = (10, 60)) -> Dict[str, Any]:
+    """
+    Downloads a URL to a file, resuming with HTTP Range requests after a dropped connection.
+
+    The body is written to filename + ".part" and a checkpoint with the URL and the
+    validators of the response (ETag / Last-Modified) is kept in filename + ".part.json".
+    A later attempt, in this call or in a later run, continues from the size of the
+    partial file with Range and If-Range; if the server answers 200 instead of 206 the
+    download restarts from byte 0. The file is moved into place only once complete.
+    Requests ask for Accept-Encoding: identity, since byte offsets into a compressed body
+    do not match the size of the decoded partial file; a body that fails to decode anyway
+    is discarded and the download restarts.
+
+    Args:
+        url (str): The URL to download.
+        filename (str): Destination path.
+        session (requests.Session, optional): Session to use. Defaults to the shared pooled session.
+        headers (dict, optional): Extra request headers, e.g. conditional headers. They are
+            only sent when starting from byte 0.
+        sink (optional): Object with update(chunk) and reset() methods that sees every byte
+            of the final file exactly once and in order, e.g. a checksum accumulator.
+        retries (int, optional): Number of retries after the first attempt. Defaults to 5.
+        backoff (float, optional): Base backoff delay in seconds. Defaults to 0.5.
+        max_backoff (float, optional): Maximum backoff delay in seconds. Defaults to 30.
+        chunk_size (int, optional): Size in bytes of the chunks read from the network.
+        timeout (optional): Connect and read timeouts passed to requests.
+
+    Returns:
+        dict: path, status (200 or 304), bytes, etag, last_modified, resumed and attempts.
+    """
+    session = session or get_session()
+    part_filename = filename + ".part"
+    checkpoint = _read_checkpoint(part_filename, url)
+    if checkpoint:
+        if sink is not None:
+            _replay_partial(part_filename, sink, chunk_size)
+        logging.info(f"Resuming {url} from byte {os.path.getsize(part_filename)}")
+    else:
+        _discard_partial(part_filename)
+    resumed = False
+
+    for attempt in range(retries + 1):
+        offset = os.path.getsize(part_filename) if checkpoint else 0
+        request_headers = {}
+        if offset:
+            request_headers["Range"] = f"bytes={offset}-"
+            validator = checkpoint.get("etag") or checkpoint.get("last_modified")
+            if validator:
+                request_headers["If-Range"] = validator
+        else:
+            request_headers.update(headers or {})
+        request_headers["Accept-Encoding"] = "identity"
+        try:
+            with session.get(url, headers=request_headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 304 and not offset:
+                    _discard_partial(part_filename)
+                    return {"path": filename, "status": 304, "bytes": None,
+                            "etag": response.headers.get("ETag"),
+                            "last_modified": response.headers.get("Last-Modified"),
+                            "resumed": False, "attempts": attempt + 1}
+                if response.status_code == 416:
+                    # The partial file no longer matches the resource; start over.
+                    raise requests.exceptions.HTTPError(f"416 from {url}", response=response)
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    raise requests.exceptions.HTTPError(f"{response.status_code} from {url}", response=response)
+                response.raise_for_status()
+
+                start, total = _content_range(response)
+                if response.status_code == 206 and offset and start == offset:
+                    resumed = True
+                    expected = total
+                    mode = "ab"
+                else:
+                    if offset:
+                        logging.info(f"{url} does not support resuming, restarting from byte 0")
+                    offset = 0
+                    if sink is not None:
+                        sink.reset()
+                    length = response.headers.get("Content-Length")
+                    expected = int(length) if length is not None and "Content-Encoding" not in response.headers else None
+                    mode = "wb"
+                    checkpoint = {
+                        "url": url,
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                        "total": expected,
+                    }
+                    _write_checkpoint(part_filename, checkpoint)
+
+                with open(part_filename, mode) as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        if sink is not None:
+                            sink.update(chunk)
+
+                size = os.path.getsize(part_filename)
+                if expected is not None and size < expected:
+                    raise requests.exceptions.ChunkedEncodingError(
+                        f"Connection closed after {size} of {expected} bytes")
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError,
+                requests.exceptions.HTTPError) as e:
+            if isinstance(e, requests.exceptions.ContentDecodingError) or \
+                    isinstance(e, requests.exceptions.HTTPError) and e.response is not None \
+                    and e.response.status_code == 416:
+                _discard_partial(part_filename)
+                checkpoint = {}
+                if sink is not None:
+                    sink.reset()
+            elif not _is_retryable(e):
+                logging.error(f"Error downloading file from URL: {e}")
+                raise
+            if attempt >= retries:
+                logging.error(f"Error downloading file from URL after {attempt + 1} attempts: {e}")
+                raise
+            delay = backoff_delay(attempt, backoff, max_backoff)
+            logging.warning(f"Downloading {url} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        os.replace(part_filename, filename)
+        os.remove(part_filename + ".json")
+        return {"path": filename, "status": 200, "bytes": size,
+                "etag": checkpoint.get("etag"), "last_modified": checkpoint.get("last_modified"),
+                "resumed": resumed, "attempts": attempt + 1}
+
+
+def _content_range(response: requests.Response) -> Tuple[Optional[int], Optional[int]]:
+    # Content-Range: bytes 100-199/200
+    byte_range, _, total = response.headers.get("Content-Range", "").partition("/")
+    start = byte_range.replace("bytes", "").strip().partition("-")[0]
+    return (int(start) if start.isdigit() else None,
+            int(total) if total.isdigit() else None)
@@ -0,0 +1,167 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+# Surrogate IDs given to the rows of each fact output, aligned with the watermark's ids
+# (0 where none was given yet), and the last ID given in each output.
+ID_MAPS = {"crime_ids": "last_id", "hourly_ids": "last_hourly_id"}
+
+
+def read_watermark(path: str) -> dict:
+    """
+    Reads the watermark of a source, or returns an empty one on the first run.
+
+    The watermark holds the latest date processed and the rows already processed as two
+    aligned uint64 arrays sorted by the first: a hash of each row's ID and a hash of its
+    content. Sixteen bytes per row keep it small even for the whole crimes history. For each
+    fact output of ID_MAPS it also holds the surrogate ID given to each row, aligned with
+    the same arrays, and the last ID given (see assign_ids).
+
+    Args:
+        path (str): Path of the .npz file.
+
+    Returns:
+        dict: max_date (pd.Timestamp or None), ids and hashes (np.ndarray), and the arrays
+        and last IDs of ID_MAPS.
+    """
+    if not os.path.exists(path):
+        watermark = {"max_date": None, "ids": np.empty(0, dtype=np.uint64), "hashes": np.empty(0, dtype=np.uint64)}
+        for ids_key, last_key in ID_MAPS.items():
+            watermark[ids_key] = np.zeros(0, dtype=np.int64)
+            watermark[last_key] = 0
+        return watermark
+    with np.load(path) as state:
+        max_date = str(state["max_date"])
+        watermark = {
+            "max_date": pd.Timestamp(max_date) if max_date else None,
+            "ids": state["ids"],
+            "hashes": state["hashes"],
+        }
+        for ids_key, last_key in ID_MAPS.items():
+            # Watermarks written before an output had its map: no row has an ID in it yet.
+            watermark[ids_key] = state[ids_key] if ids_key in state else np.zeros(len(state["ids"]), dtype=np.int64)
+            watermark[last_key] = int(state[last_key]) if last_key in state else 0
+        return watermark
+
+
+def write_watermark(path: str, watermark: dict) -> None:
+    """
+    Writes the watermark of a source, replacing the previous one atomically.
+
+    Args:
+        path (str): Path of the .npz file.
+        watermark (dict): The watermark, as returned by read_watermark or select_delta.
+
+    Raises:
+        Exception: If writing the file fails.
+    """
+    max_date = watermark["max_date"]
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        id_maps = {}
+        for ids_key, last_key in ID_MAPS.items():
+            id_maps[ids_key] = watermark[ids_key]
+            id_maps[last_key] = np.array(watermark[last_key])
+        np.savez(tmp_path, max_date=np.array("" if max_date is None else max_date.isoformat()),
+                 ids=watermark["ids"], hashes=watermark["hashes"], **id_maps)
+        os.replace(tmp_path, path)
+        logging.info(f"Watermark saved to {path} (up to {max_date}, {len(watermark['ids'])} rows)")
+    except Exception as e:
+        logging.error(f"Error saving watermark: {e}")
+        raise
+
+
+def select_delta(df: pd.DataFrame, id_columns: list, date_column: str, watermark: dict,
+                 lookback_days: int = 30):
+    """
+    Selects the rows of a source that are new or changed since the watermark.
+
+    Rows dated more than lookback_days before the watermark's date are taken as settled and
+    skipped without hashing. The other rows are looked up by the hash of their ID in the
+    watermark: rows with an unknown ID are new, rows whose content hash differs were changed
+    at the source, and the others are unchanged. The IDs must be unique within df.
+
+    Args:
+        df (pd.DataFrame): Rows of the source.
+        id_columns (list): Columns identifying a row, e.g. ["INCIDENT_NUMBER"].
+        date_column (str): Datetime column the watermark follows.
+        watermark (dict): Watermark returned by read_watermark.
+        lookback_days (int, optional): How far back before the watermark's date rows may
+            still change. Defaults to 30.
+
+    Returns:
+        tuple: The new and changed rows, and the updated watermark (IDs are left to assign_ids).
+    """
+    max_date = watermark["max_date"]
+    if max_date is not None and len(df):
+        df = df[df[date_column] >= max_date - pd.Timedelta(days=lookback_days)]
+
+    ids = pd.util.hash_pandas_object(df[id_columns], index=False).to_numpy()
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    known_ids, known_hashes = watermark["ids"], watermark["hashes"]
+    known = np.zeros(len(ids), dtype=bool)
+    changed = np.zeros(len(ids), dtype=bool)
+    updated_hashes = known_hashes.copy()
+    if len(known_ids):
+        positions = np.minimum(np.searchsorted(known_ids, ids), len(known_ids) - 1)
+        known = known_ids[positions] == ids
+        changed = known & (known_hashes[positions] != hashes)
+        updated_hashes[positions[changed]] = hashes[changed]
+    new = ~known
+
+    all_ids = np.concatenate([known_ids, ids[new]])
+    all_hashes = np.concatenate([updated_hashes, hashes[new]])
+    order = np.argsort(all_ids, kind="stable")
+
+    if len(df):
+        latest = df[date_column].max()
+        max_date = latest if max_date is None else max(max_date, latest)
+    logging.info(f"Delta: {int(new.sum())} new, {int(changed.sum())} changed, "
+                 f"{int(known.sum() - changed.sum())} unchanged rows since {watermark['max_date']}")
+    updated = {"max_date": max_date, "ids": all_ids[order], "hashes": all_hashes[order]}
+    for ids_key, last_key in ID_MAPS.items():
+        updated[ids_key] = np.concatenate([watermark[ids_key], np.zeros(int(new.sum()), dtype=np.int64)])[order]
+        updated[last_key] = watermark[last_key]
+    return df[new | changed], updated
+
+
+def assign_ids(df: pd.DataFrame, id_columns: list, watermark: dict, ids_key: str = "crime_ids") -> np.ndarray:
+    """
+    Gives the rows of a fact output built from a delta their surrogate IDs. A row whose ID
+    columns were given an ID in an earlier run keeps it, so a changed row is updated in place
+    by the loader; the other rows are numbered in order after the last ID given. The rows'
+    IDs must be in the watermark (see select_delta) and unique within df.
+
+    Args:
+        df (pd.DataFrame): Fact rows of the delta.
+        id_columns (list): Columns identifying a row, as given to select_delta.
+        watermark (dict): Watermark returned by select_delta; its map is updated in place.
+        ids_key (str, optional): Map of the output, a key of ID_MAPS. Defaults to "crime_ids".
+
+    Returns:
+        np.ndarray: The int64 ID of each row.
+
+    Raises:
+        ValueError: If a row's ID is not in the watermark or appears twice in df.
+    """
+    last_key = ID_MAPS[ids_key]
+    ids = pd.util.hash_pandas_object(df[id_columns], index=False).to_numpy()
+    known_ids = watermark["ids"]
+    positions = np.minimum(np.searchsorted(known_ids, ids), max(len(known_ids) - 1, 0))
+    if len(ids) and (not len(known_ids) or (known_ids[positions] != ids).any()):
+        raise ValueError(f"Rows of the {ids_key} output are missing from the watermark")
+    if len(np.unique(positions)) != len(positions):
+        raise ValueError(f"Rows of the {ids_key} output repeat an ID of {id_columns}")
+
+    assigned = watermark[ids_key][positions]
+    new = assigned == 0
+    assigned[new] = np.arange(watermark[last_key] + 1, watermark[last_key] + 1 + int(new.sum()))
+    watermark[ids_key][positions[new]] = assigned[new]
+    watermark[last_key] += int(new.sum())
+    logging.info(f"IDs of {ids_key}: {int(new.sum())} new, {int((~new).sum())} kept")
+    return assigned
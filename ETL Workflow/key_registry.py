@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+
+class KeyRegistry:
+    """
+    Persistent surrogate keys of one dimension.
+
+    The members of the dimension are kept in the order they were first seen and a member's
+    key is its position in that list plus one, so keys are dense integers starting at 1 that
+    never change once assigned: a later run only appends the members it has not seen before.
+    The registry is stored as a small JSON file, e.g. key_registry/DISTRICT.json. A missing
+    value (NaN) is a member like any other.
+
+    Args:
+        path (str, optional): Path of the JSON file. Without a path the registry only lives
+            in memory and save() does nothing.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.members = []
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                self.members = [np.nan if member is None else member for member in json.load(f)["members"]]
+        self._index = pd.Index(self.members, dtype=object)
+        self._saved = len(self.members)
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def lookup(self, values: pd.Series) -> np.ndarray:
+        """
+        Map values to their keys, registering the values not seen before in order of first
+        appearance. The values are factorized once and only their distinct members are looked
+        up in the registry.
+
+        Args:
+            values (pd.Series): Values of the dimension's natural key, e.g. df["DISTRICT"].
+
+        Returns:
+            np.ndarray: The int64 key of each value.
+        """
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        uniques = pd.Index(np.asarray(uniques, dtype=object), dtype=object)
+        positions = self._index.get_indexer(uniques)
+        new_members = uniques[positions < 0]
+        if len(new_members):
+            self.members.extend(new_members)
+            self._index = pd.Index(self.members, dtype=object)
+            positions = self._index.get_indexer(uniques)
+        return (positions + 1).astype(np.int64)[codes]
+
+    def to_frame(self, key_name: str, column: str) -> pd.DataFrame:
+        """
+        Return the registered members and their keys.
+
+        Args:
+            key_name (str): Name of the key column.
+            column (str): Name of the member column.
+
+        Returns:
+            pd.DataFrame: One row per member, ordered by key.
+        """
+        return pd.DataFrame({key_name: np.arange(1, len(self.members) + 1), column: self.members})
+
+    def save(self) -> None:
+        """
+        Write the registry to its JSON file if members were added since it was loaded.
+
+        Raises:
+            Exception: If writing the file fails.
+        """
+        if not self.path or len(self.members) == self._saved:
+            return
+        members = [None if pd.isna(member) else getattr(member, "item", lambda: member)() for member in self.members]
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"members": members}, f, indent=1)
+            os.replace(tmp_path, self.path)
+            logging.info(f"Key registry saved to {self.path} ({len(members) - self._saved} new members)")
+            self._saved = len(members)
+        except Exception as e:
+            logging.error(f"Error saving key registry: {e}")
+            raise
+
+
+def registry_path(registry_dir: str, dimension: str) -> str:
+    """
+    Return the path of the registry file of a dimension.
+
+    Args:
+        registry_dir (str): Folder of the registries.
+        dimension (str): Name of the dimension, e.g. "DISTRICT".
+
+    Returns:
+        str: Path of the JSON file.
+    """
+    return os.path.join(registry_dir, f"{dimension}.json")
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader import download_file  # noqa: E402
+from Extract_BotonGOV import cache_metadata_path, fetch_csv_if_modified  # noqa: E402
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Serves server.body with Range, If-Range, ETag and conditional request support. Each
+    request takes the next action of server.actions: "drop" closes the connection halfway
+    through the body, "ignore-range" answers 200 with the whole body, "change" drops halfway
+    and then replaces the body and its ETag, "garbage-gzip" sends a body that does not decode,
+    and "ignore-conditional" answers 200 even when If-None-Match / If-Modified-Since match.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.seen.append(dict(self.headers))
+        action = server.actions.pop(0) if server.actions else "ok"
+        if action == "garbage-gzip":
+            payload = b"this is not gzip" * 64
+            self.send_response(200)
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        if action != "ignore-conditional" and self._not_modified():
+            self.send_response(304)
+            self.send_header("ETag", server.etag)
+            self.send_header("Last-Modified", server.last_modified)
+            self.end_headers()
+            return
+
+        start = 0
+        byte_range = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if byte_range and action != "ignore-range" and (if_range is None or if_range == server.etag):
+            start = int(byte_range.split("=")[1].split("-")[0])
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(server.body) - 1}/{len(server.body)}")
+        else:
+            self.send_response(200)
+        payload = server.body[start:]
+        self.send_header("ETag", server.etag)
+        self.send_header("Last-Modified", server.last_modified)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if action in ("drop", "change"):
+            self.wfile.write(payload[:len(payload) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            if action == "change":
+                server.body, server.etag = server.next_body, '"v2"'
+            return
+        self.wfile.write(payload)
+
+    def _not_modified(self):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return if_none_match == self.server.etag
+        return self.headers.get("If-Modified-Since") == self.server.last_modified
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.body = os.urandom(200000)
+        self.server.next_body = os.urandom(150000)
+        self.server.etag = '"v1"'
+        self.server.last_modified = "Wed, 01 Jan 2025 00:00:00 GMT"
+        self.server.actions = []
+        self.server.seen = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/data.csv"
+        self.folder = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.folder.name, "data.csv")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.folder.cleanup()
+
+    def read(self):
+        with open(self.filename, "rb") as f:
+            return f.read()
+
+
+class DownloadFileTest(_ServerTestCase):
+
+    def download(self):
+        with requests.Session() as session:
+            return download_file(self.url, self.filename, session=session, retries=3, backoff=0.01)
+
+    def assertNoPartial(self):
+        self.assertFalse(os.path.exists(self.filename + ".part"))
+        self.assertFalse(os.path.exists(self.filename + ".part.json"))
+
+    def test_full_download(self):
+        result = self.download()
+        self.assertEqual(self.read(), self.server.body)
+        self.assertEqual((result["status"], result["resumed"], result["attempts"]), (200, False, 1))
+        self.assertEqual(self.server.seen[0].get("Accept-Encoding"), "identity")
+        self.assertNoPartial()
+
+    def test_resume_after_dropped_connection(self):
+        self.server.actions = ["drop"]
+        result = self.download()
+        self.assertEqual(self.read(), self.server.body)
+        self.assertEqual((result["resumed"], result["attempts"]), (True, 2))
+        # Resumed from what reached the partial file, at most what was sent before the drop.
+        offset = int(self.server.seen[1]["Range"].split("=")[1].rstrip("-"))
+        self.assertTrue(0 < offset <= len(self.server.body) // 2)
+        self.assertEqual(self.server.seen[1]["If-Range"], '"v1"')
+        self.assertEqual(self.server.seen[1]["Accept-Encoding"], "identity")
+        self.assertNoPartial()
+
+    def test_restart_when_range_is_ignored(self):
+        self.server.actions = ["drop", "ignore-range"]
+        result = self.download()
+        self.assertEqual(self.read(), self.server.body)
+        self.assertEqual((result["resumed"], result["attempts"]), (False, 2))
+        self.assertIn("Range", self.server.seen[1])
+        self.assertNoPartial()
+
+    def test_restart_when_etag_changes(self):
+        self.server.actions = ["change"]
+        result = self.download()
+        self.assertEqual(self.read(), self.server.next_body)
+        self.assertEqual((result["resumed"], result["etag"]), (False, '"v2"'))
+        self.assertNoPartial()
+
+    def test_restart_when_body_does_not_decode(self):
+        self.server.actions = ["garbage-gzip"]
+        result = self.download()
+        self.assertEqual(self.read(), self.server.body)
+        self.assertEqual((result["resumed"], result["attempts"]), (False, 2))
+        self.assertNoPartial()
+
+
+class FetchCsvIfModifiedTest(_ServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.body = b"incident_num,district\r\n" + b"".join(b"I%05d,B2\r\n" % i for i in range(5000))
+        self.server.next_body = self.server.body + b"I99999,C11\r\n"
+
+    def read_metadata(self):
+        with open(cache_metadata_path(self.filename)) as f:
+            return json.load(f)
+
+    def test_first_download_writes_metadata(self):
+        result = fetch_csv_if_modified(self.url, self.filename, num_rows=2)
+        self.assertFalse(result["not_modified"])
+        self.assertEqual(self.read(), self.server.body)
+        self.assertEqual(result["preview"], [{"incident_num": "I00000", "district": "B2"},
+                                             {"incident_num": "I00001", "district": "B2"}])
+        metadata = self.read_metadata()
+        self.assertEqual((metadata["etag"], metadata["last_modified"]), ('"v1"', self.server.last_modified))
+        self.assertEqual((metadata["bytes"], metadata["rows"]), (len(self.server.body), 5000))
+        self.assertEqual(metadata["sha256"], hashlib.sha256(self.server.body).hexdigest())
+
+    def test_not_modified_answer(self):
+        fetch_csv_if_modified(self.url, self.filename)
+        result = fetch_csv_if_modified(self.url, self.filename)
+        self.assertEqual(self.server.seen[1]["If-None-Match"], '"v1"')
+        self.assertEqual(self.server.seen[1]["If-Modified-Since"], self.server.last_modified)
+        self.assertTrue(result["not_modified"])
+        # Answered with the cached metadata, without reading a body.
+        self.assertEqual(result["preview"], [])
+        self.assertEqual(self.read(), self.server.body)
+
+    def test_same_body_is_not_modified(self):
+        fetch_csv_if_modified(self.url, self.filename)
+        self.server.actions = ["ignore-conditional"]
+        result = fetch_csv_if_modified(self.url, self.filename)
+        self.assertTrue(result["not_modified"])
+        self.assertEqual(self.read(), self.server.body)
+
+    def test_changed_body_updates_metadata(self):
+        fetch_csv_if_modified(self.url, self.filename)
+        self.server.body, self.server.etag = self.server.next_body, '"v2"'
+        result = fetch_csv_if_modified(self.url, self.filename)
+        self.assertFalse(result["not_modified"])
+        self.assertEqual(self.read(), self.server.next_body)
+        metadata = self.read_metadata()
+        self.assertEqual((metadata["etag"], metadata["rows"]), ('"v2"', 5001))
+        self.assertEqual(metadata["sha256"], hashlib.sha256(self.server.next_body).hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main()
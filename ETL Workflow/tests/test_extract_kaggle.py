@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+from zipfile import ZipFile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing the kaggle package authenticates straight away, so the tests import
+# Extract_Kaggle against a placeholder module and pass their own api instead.
+_kaggle_api = types.ModuleType("kaggle.api.kaggle_api_extended")
+_kaggle_api.KaggleApi = None
+with mock.patch.dict(sys.modules, {"kaggle": types.ModuleType("kaggle"),
+                                   "kaggle.api": types.ModuleType("kaggle.api"),
+                                   "kaggle.api.kaggle_api_extended": _kaggle_api}):
+    from Extract_Kaggle import download_dataset_kaggle_cached  # noqa: E402
+
+DATASET = "AnalyzeBoston/crimes-in-boston"
+CSV = b"INCIDENT_NUMBER,DISTRICT\r\nI182070945,B2\r\nI182070943,C11\r\n"
+
+
+class _StubApi:
+    """Answers dataset_list with the current version and writes a small archive on download."""
+
+    def __init__(self, version=1):
+        self.version = version
+        self.downloads = 0
+
+    def authenticate(self):
+        pass
+
+    def dataset_list(self, search=None, user=None):
+        return [types.SimpleNamespace(ref=DATASET, currentVersionNumber=self.version,
+                                      lastUpdated=f"2024-01-0{self.version} 00:00:00")]
+
+    def dataset_download_files(self, dataset_name, path=None, force=False, quiet=True):
+        self.downloads += 1
+        with ZipFile(os.path.join(path, dataset_name.split("/")[-1] + ".zip"), "w") as zip_ref:
+            zip_ref.writestr("crime.csv", CSV)
+
+
+class DownloadDatasetKaggleCachedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.api = _StubApi()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def download(self):
+        return download_dataset_kaggle_cached(DATASET, cache_dir=self.folder.name, api=self.api)
+
+    def read_manifest(self, csv_path):
+        with open(os.path.join(os.path.dirname(csv_path), "manifest.json")) as f:
+            return json.load(f)
+
+    def test_first_call_downloads_and_writes_manifest(self):
+        csv_path = self.download()
+        self.assertEqual(self.api.downloads, 1)
+        with open(csv_path, "rb") as f:
+            self.assertEqual(f.read(), CSV)
+        self.assertFalse(os.path.exists(os.path.join(os.path.dirname(csv_path), "crimes-in-boston.zip")))
+        manifest = self.read_manifest(csv_path)
+        self.assertEqual((manifest["dataset"], manifest["version"]), (DATASET, 1))
+        self.assertEqual((manifest["size"], manifest["sha256"]), (len(CSV), hashlib.sha256(CSV).hexdigest()))
+
+    def test_same_version_uses_the_cache(self):
+        first = self.download()
+        second = self.download()
+        self.assertEqual(first, second)
+        self.assertEqual(self.api.downloads, 1)
+
+    def test_version_bump_downloads_again(self):
+        self.download()
+        self.api.version = 2
+        csv_path = self.download()
+        self.assertEqual(self.api.downloads, 2)
+        self.assertEqual(self.read_manifest(csv_path)["version"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
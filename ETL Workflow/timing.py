@@ -0,0 +1,22 @@
+import time
+from typing import Any, Callable, Dict
+
+
+def timed_call(func: Callable, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Calls a function and reports its outcome instead of raising, for the tasks of a pool.
+
+    Args:
+        func (callable): The function to call.
+        kwargs (dict): Keyword arguments of the call.
+
+    Returns:
+        dict: status (ok or error), result or error, and the wall-clock seconds of the call.
+    """
+    started = time.perf_counter()
+    try:
+        outcome = {"status": "ok", "result": func(**kwargs)}
+    except Exception as e:
+        outcome = {"status": "error", "error": str(e)}
+    outcome["seconds"] = round(time.perf_counter() - started, 3)
+    return outcome